@@ -0,0 +1,92 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import fnmatch
+import os
+import sys
+import tempfile
+
+from .app import create_app
+from .cases import CASES
+from .runner import Context, compare, load, run, save
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Flask-Pony benchmarks.')
+    parser.add_argument('-r', '--rows', type=int, default=1000, help='The number of seeded rows.')
+    parser.add_argument('-n', '--iterations', type=int, default=200, help='The number of measured runs of each case.')
+    parser.add_argument('-w', '--warmup', type=int, default=20, help='The number of runs before measuring.')
+    parser.add_argument('-k', '--select', action='append', help='Run only cases matching the pattern, e.g. "view.*".')
+    parser.add_argument('--no-memory', action='store_true', help='Do not measure the peak memory.')
+    parser.add_argument('--save', metavar='FILE', help='Save the results as the baseline.')
+    parser.add_argument('--compare', metavar='FILE', help='Compare the results with the baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='The allowed growth of a metric before it is reported as a regression.')
+    parser.add_argument('--list', action='store_true', help='List the cases and exit.')
+    return parser.parse_args(argv)
+
+
+def select_cases(patterns):
+    if not patterns:
+        return list(CASES)
+    return [(name, f) for name, f in CASES if any(fnmatch.fnmatch(name, p) for p in patterns)]
+
+
+def print_result(name, result):
+    memory = result['peak_memory_kb']
+    print('{:<30} {:>10.1f} {:>9.3f} {:>9.3f} {:>9.3f} {:>8.2f} {:>10}'.format(
+        name, result['ops_per_sec'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+        result['queries_per_op'], '-' if memory is None else '{:.1f}'.format(memory)))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cases = select_cases(args.select)
+
+    if args.list:
+        for name, _ in cases:
+            print(name)
+        return 0
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='flask_pony_bench_'), 'bench.sqlite')
+    app, pony_ext, models = create_app(db_path, args.rows)
+
+    print('{:<30} {:>10} {:>9} {:>9} {:>9} {:>8} {:>10}'.format(
+        'case', 'ops/sec', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak KiB'))
+
+    data = run(Context(app, pony_ext, models, args.rows), cases,
+               args.iterations, args.warmup, not args.no_memory, print_result)
+
+    if args.save:
+        save(data, args.save)
+
+    if not args.compare:
+        return 0
+
+    regressions = 0
+    print('\n{:<30} {:<15} {:>12} {:>12} {:>8}'.format('case', 'metric', 'baseline', 'current', 'change'))
+
+    for name, metric, old, new, change, regressed in compare(load(args.compare), data, args.tolerance):
+        regressions += regressed
+        print('{:<30} {:<15} {:>12.3f} {:>12.3f} {:>+7.1%}{}'.format(
+            name, metric, old, new, change, '  REGRESSION' if regressed else ''))
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from datetime import datetime
+
+from flask import Flask
+from jinja2 import DictLoader
+from pony.orm import Optional, Required, Set, db_session
+
+from flask_pony import Pony
+from flask_pony.forms import EntityField
+from flask_pony.repositories import PonyRepository
+from flask_pony.views import CreateView, ListView, ShowView, UpdateView
+
+
+TEMPLATES = {
+    'list.html': '{% for e in entities %}{{ e.id }} {{ e.title }}\n{% endfor %}',
+    'show.html': '{{ entity.title }} {{ entity.body }} {{ entity.category.title }}',
+    'form.html': '{% for field in form %}{{ field() }}{% endfor %}',
+}
+
+
+def create_app(db_path, rows=1000, categories=20):
+    """
+    Creates the application with a SQLite database seeded with the given number of rows.
+
+    Returns:
+        tuple: The application, the extension and the dict with the entity and repository classes.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    app = Flask(__name__)
+    app.jinja_loader = DictLoader(TEMPLATES)
+    app.config.update(
+        SECRET_KEY='benchmark',
+        WTF_CSRF_ENABLED=False,
+        PONY={'provider': 'sqlite', 'dbname': db_path, 'create_db': True},
+        PONY_INSTRUMENTATION=True,
+        PONY_N_PLUS_ONE_THRESHOLD=None,
+    )
+
+    pony = Pony(app)
+    db = pony.db
+
+    class Category(db.Entity):
+        title = Required(str, unique=True)
+        posts = Set('Post')
+
+        def __str__(self):
+            return self.title
+
+    class Post(db.Entity):
+        title = Required(str)
+        body = Optional(str)
+        category = Required(Category)
+        created = Required(datetime, default=datetime.now)
+
+    class CategoryRepository(PonyRepository):
+        entity_class = Category
+
+    class PostRepository(PonyRepository):
+        entity_class = Post
+
+    class PostList(ListView):
+        repository_class = PostRepository
+        template_name = 'list.html'
+        paginate_by = 50
+
+    class PostShow(ShowView):
+        repository_class = PostRepository
+        template_name = 'show.html'
+
+    class PostCreate(CreateView):
+        repository_class = PostRepository
+        template_name = 'form.html'
+        success_endpoint = 'post_list'
+
+    class PostUpdate(UpdateView):
+        repository_class = PostRepository
+        template_name = 'form.html'
+        success_endpoint = 'post_list'
+
+    app.add_url_rule('/posts/', view_func=PostList.as_view('post_list'))
+    app.add_url_rule('/posts/<int:id>', view_func=PostShow.as_view('post_show'))
+    app.add_url_rule('/posts/new', view_func=PostCreate.as_view('post_create'))
+    app.add_url_rule('/posts/<int:id>/edit', view_func=PostUpdate.as_view('post_update'))
+
+    with app.app_context():
+        pony.connect()
+
+    seed(Category, Post, rows, categories)
+
+    models = {
+        'Category': Category,
+        'Post': Post,
+        'CategoryRepository': CategoryRepository,
+        'PostRepository': PostRepository,
+        'EntityField': EntityField,
+    }
+
+    return app, pony, models
+
+
+def seed(category_class, post_class, rows, categories):
+    with db_session:
+        items = [category_class(title='Category {}'.format(i)) for i in range(categories)]
+
+        for i in range(rows):
+            post_class(title='Post {}'.format(i), body='Body of the post {}'.format(i),
+                       category=items[i % categories])
@@ -0,0 +1,177 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from itertools import count
+
+from pony.orm import db_session
+from wtforms.meta import DefaultMeta
+
+from flask_pony.orm import FormBuilder
+
+
+CASES = []
+
+
+def case(name):
+    """Registers the benchmark case, the decorated function prepares and returns the measured operation."""
+    def decorator(func):
+        CASES.append((name, func))
+        return func
+    return decorator
+
+
+def check_status(response, *expected):
+    if response.status_code not in expected:
+        raise RuntimeError('Unexpected status {} for {}'.format(response.status_code, response.request.path))
+    return response
+
+
+def cycle_ids(ctx):
+    counter = count()
+    return lambda: next(counter) % ctx.rows + 1
+
+
+@case('view.list')
+def list_view(ctx):
+    client = ctx.app.test_client()
+    pages = max(ctx.rows // 50, 1)
+    counter = count()
+    return lambda: check_status(client.get('/posts/?page={}'.format(next(counter) % pages + 1)), 200)
+
+
+@case('view.show')
+def show_view(ctx):
+    client = ctx.app.test_client()
+    next_id = cycle_ids(ctx)
+    return lambda: check_status(client.get('/posts/{}'.format(next_id())), 200)
+
+
+@case('view.create.get')
+def create_view_get(ctx):
+    client = ctx.app.test_client()
+    return lambda: check_status(client.get('/posts/new'), 200)
+
+
+@case('view.create.post')
+def create_view_post(ctx):
+    client = ctx.app.test_client()
+    counter = count()
+
+    def op():
+        data = {'title': 'New post {}'.format(next(counter)), 'body': 'Body', 'category': '1', 'created': '2018-01-01 00:00:00'}
+        check_status(client.post('/posts/new', data=data), 302)
+
+    return op
+
+
+@case('view.update.post')
+def update_view_post(ctx):
+    client = ctx.app.test_client()
+    next_id = cycle_ids(ctx)
+    counter = count()
+
+    def op():
+        data = {'title': 'Updated post {}'.format(next(counter)), 'body': 'Body', 'category': '2', 'created': '2018-01-01 00:00:00'}
+        check_status(client.post('/posts/{}/edit'.format(next_id()), data=data), 302)
+
+    return op
+
+
+@case('form.builder')
+def form_builder(ctx):
+    post_class = ctx.models['Post']
+    return lambda: FormBuilder(post_class).get_form()
+
+
+@case('form.builder.cached')
+def form_builder_cached(ctx):
+    post_class = ctx.models['Post']
+    return lambda: FormBuilder.get_form_class(post_class)
+
+
+@case('form.entity_field.choices')
+def entity_field_choices(ctx):
+    entity_field = ctx.models['EntityField']
+    category_class = ctx.models['Category']
+
+    def op():
+        with ctx.app.test_request_context(), db_session:
+            field = entity_field(category_class).bind(None, 'category', _meta=DefaultMeta())
+            list(field.iter_choices())
+
+    return op
+
+
+@case('repository.get')
+def repository_get(ctx):
+    repository = ctx.models['PostRepository']()
+    next_id = cycle_ids(ctx)
+
+    def op():
+        with ctx.app.app_context(), db_session:
+            repository.get(next_id())
+
+    return op
+
+
+@case('repository.get_page')
+def repository_get_page(ctx):
+    repository = ctx.models['PostRepository']()
+    pages = max(ctx.rows // 50, 1)
+    counter = count()
+
+    def op():
+        with ctx.app.app_context(), db_session:
+            list(repository.get_page(next(counter) % pages + 1, 50).items)
+
+    return op
+
+
+@case('repository.get_page.keyset')
+def repository_get_page_keyset(ctx):
+    repository = ctx.models['PostRepository']()
+    state = {'after': None}
+
+    def op():
+        with ctx.app.app_context(), db_session:
+            page = repository.get_page(per_page=50, keyset=True, after=state['after'])
+            state['after'] = page.next_cursor if page.has_next else None
+
+    return op
+
+
+@case('repository.count')
+def repository_count(ctx):
+    repository = ctx.models['PostRepository']()
+
+    def op():
+        with ctx.app.app_context(), db_session:
+            repository.count()
+
+    return op
+
+
+@case('repository.update')
+def repository_update(ctx):
+    repository = ctx.models['PostRepository']()
+    next_id = cycle_ids(ctx)
+    counter = count()
+
+    def op():
+        with ctx.app.app_context(), db_session:
+            repository.update(repository.get(next_id()), body='Changed {}'.format(next(counter)))
+
+    return op
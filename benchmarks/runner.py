@@ -0,0 +1,171 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gc
+import json
+import platform
+import tracemalloc
+from timeit import default_timer
+
+import flask
+import pony
+
+from flask_pony.instrumentation import instrument_database
+from flask_pony.slowlog import percentile
+
+
+REGRESSION_METRICS = ('p50_ms', 'queries_per_op', 'peak_memory_kb')
+
+
+class Context(object):
+    """The shared state of the benchmark cases."""
+
+    def __init__(self, app, pony_ext, models, rows):
+        self.app = app
+        self.pony = pony_ext
+        self.models = models
+        self.rows = rows
+
+
+class QueryCounter(object):
+    """Counts all executed SQL statements."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, sql, duration):
+        self.count += 1
+
+
+def measure(op, iterations, warmup, counter, memory=True):
+    """
+    Runs the operation and returns its statistics.
+
+    The peak memory is measured by a separate run with tracemalloc enabled,
+    because tracing slows down the operation and would distort the timings.
+    """
+    for _ in range(warmup):
+        op()
+
+    timings = []
+    queries = counter.count
+    gc.collect()
+    started = default_timer()
+
+    for _ in range(iterations):
+        start = default_timer()
+        op()
+        timings.append(default_timer() - start)
+
+    elapsed = default_timer() - started
+    queries = counter.count - queries
+    timings.sort()
+
+    result = {
+        'iterations': iterations,
+        'ops_per_sec': iterations / elapsed if elapsed else 0.0,
+        'mean_ms': elapsed / iterations * 1000,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'queries_per_op': float(queries) / iterations,
+        'peak_memory_kb': None,
+    }
+
+    if memory:
+        tracemalloc.start()
+        try:
+            for _ in range(max(iterations // 10, 1)):
+                op()
+            result['peak_memory_kb'] = tracemalloc.get_traced_memory()[1] / 1024.0
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def run(ctx, cases, iterations, warmup, memory=True, report=None):
+    """
+    Runs the cases and returns the benchmark results.
+
+    Arguments:
+        ctx (:py:class:`Context`): The benchmark context.
+        cases (list): Pairs (name, factory), the factory returns the measured operation.
+        report (callable): Called with the name and the statistics of each finished case.
+    """
+    counter = QueryCounter()
+    instrument_database(ctx.pony.db, counter)
+
+    results = {}
+
+    for name, factory in cases:
+        op = factory(ctx)
+        results[name] = measure(op, iterations, warmup, counter, memory)
+
+        if report is not None:
+            report(name, results[name])
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'flask': flask.__version__,
+            'pony': pony.__version__,
+            'rows': ctx.rows,
+            'iterations': iterations,
+        },
+        'results': results,
+    }
+
+
+def save(data, filename):
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Compares the results with the baseline.
+
+    The case regresses if its median latency, the number of queries
+    or the peak memory grows by more than the tolerance (a fraction).
+    The p95 latency is too noisy on short runs, so it is only shown.
+
+    Returns:
+        list: Tuples (name, metric, baseline value, current value, change, regressed).
+    """
+    rows = []
+
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+
+        if base is None:
+            continue
+
+        for metric in ('p50_ms', 'p95_ms', 'queries_per_op', 'peak_memory_kb'):
+            old, new = base.get(metric), result.get(metric)
+
+            if old is None or new is None:
+                continue
+
+            change = (new - old) / old if old else (0.0 if new == old else float('inf'))
+            rows.append((name, metric, old, new, change, metric in REGRESSION_METRICS and change > tolerance))
+
+    return rows
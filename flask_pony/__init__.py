@@ -16,19 +16,65 @@
 
 from __future__ import print_function, unicode_literals
 
-from flask import current_app, has_app_context, has_request_context
-from pony.orm import db_session
-from pony.orm.core import local
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+import logging
+from threading import Lock
+from timeit import default_timer
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from pony.orm import core, db_session, rollback
 from pony_database_facade import DatabaseFacade
+from six import string_types
 
+from .cache import MemoryCache, invalidate_changed, track_changes
+from .cli import pony_cli
 from .compat import get_exc_info
+from .context import install_context_local
+from .instrumentation import get_query_stats, instrument_database, report_query_stats, start_query_stats
+from .pooling import iter_pools, keep_alive, reset_pool, use_session_pools, warm_up
+from .routing import RoutingPool, create_replica_pool, pin_to_primary, route_writes, select_route
+from .slowlog import SlowQueryLog
 
 __version__ = '3.0.1'
 
 
+logger = logging.getLogger('flask_pony')
+
+
 def has_db_session():
     """Returns True if db_session exists"""
-    return local.db_context_counter > 0
+    return core.local.db_context_counter > 0
+
+
+def get_session_options():
+    """
+    Returns the db_session options for the current request.
+
+    The options are merged in the following order (the latter wins):
+    ``PONY_SESSION_POLICY`` for the HTTP method,
+    ``PONY_BLUEPRINT_SESSION_POLICY`` for the blueprint and the HTTP method,
+    the ``session_policy`` attribute of the view class for the HTTP method.
+
+    Besides the :py:func:`db_session` arguments, the ``readonly`` option is supported:
+    all changes made in a read-only session are rolled back when it ends.
+    """
+    config = current_app.config
+    method = request.method
+    options = {}
+
+    options.update(config.get('PONY_SESSION_POLICY', {}).get(method, {}))
+
+    if request.blueprint:
+        policy = config.get('PONY_BLUEPRINT_SESSION_POLICY', {}).get(request.blueprint, {})
+        options.update(policy.get(method, {}))
+
+    view = current_app.view_functions.get(request.endpoint)
+    policy = getattr(getattr(view, 'view_class', None), 'session_policy', None) or {}
+    options.update(policy.get(method, {}))
+
+    return options
 
 
 def start_db_session():
@@ -41,7 +87,46 @@ def start_db_session():
     if not has_app_context() or not has_request_context():
         raise RuntimeError('You need app_context or request_context')
 
-    db_session.__enter__()
+    options = get_session_options()
+    readonly = options.pop('readonly', False)
+
+    select_route(readonly, options.pop('replica', None))
+
+    session = db_session(**options) if options else db_session
+    session.__enter__()
+
+    g._pony_session_used = True
+    g._pony_session_readonly = readonly
+
+    start_query_stats()
+
+
+def is_readonly_session():
+    """Returns True if the db_session of the current request is read-only"""
+    return has_app_context() and bool(g.get('_pony_session_readonly', False))
+
+
+def db_session_used():
+    """Returns True if the db_session was opened during the current request"""
+    return bool(g.get('_pony_session_used', False))
+
+
+def lazy_db_session(get_cache):
+    """
+    Wraps the :py:meth:`Database._get_cache` method,
+    so that the db_session starts on the first access to the database.
+    """
+    if getattr(get_cache, '__pony_lazy__', False):
+        return get_cache
+
+    @wraps(get_cache)
+    def wrapper(*args, **kwargs):
+        if not has_db_session() and has_request_context():
+            start_db_session()
+        return get_cache(*args, **kwargs)
+
+    wrapper.__pony_lazy__ = True
+    return wrapper
 
 
 def stop_db_session(exc=None):
@@ -51,18 +136,67 @@ def stop_db_session(exc=None):
     if has_db_session():
         exc_type = None
         tb = None
+        stats = get_query_stats()
 
         if exc:
             exc_type, exc, tb = get_exc_info(exc)
+        elif is_readonly_session():
+            rollback()
+
+        try:
+            core.local.db_session.__exit__(exc_type, exc, tb)
+        finally:
+            invalidate_changed()
+
+        if stats is not None:
+            report_query_stats(stats)
 
-        db_session.__exit__(exc_type, exc, tb)
+
+@contextmanager
+def _timing(timings, step):
+    started = default_timer()
+    try:
+        yield
+    finally:
+        timings[step] += default_timer() - started
+
+
+class SessionStats(object):
+    """Counts the requests and how many of them used the database."""
+
+    __slots__ = ('__lock', 'requests', 'sessions')
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.requests = 0
+        self.sessions = 0
+
+    def record(self, used):
+        with self.__lock:
+            self.requests += 1
+            if used:
+                self.sessions += 1
+
+    def as_dict(self):
+        with self.__lock:
+            return {
+                'requests': self.requests,
+                'sessions': self.sessions,
+                'without_session': self.requests - self.sessions,
+            }
 
 
 class Pony(object):
-    __slots__ = ('__facade', 'app')
+    __slots__ = ('__facade', '__binds', '__stats', '__cache', '__sinks', '__slow_log', '__boot_timings', 'app')
 
     def __init__(self, app=None):
         self.__facade = DatabaseFacade()
+        self.__binds = {}
+        self.__stats = SessionStats()
+        self.__cache = None
+        self.__sinks = []
+        self.__slow_log = None
+        self.__boot_timings = {}
 
         self.app = app
 
@@ -82,18 +216,297 @@ class Pony(object):
     def db(self):
         return self.__facade.original
 
+    def get_db(self, bind=None):
+        """
+        Returns the database of the named bind, its settings are taken from the ``PONY_BINDS`` option.
+
+        Arguments:
+            bind (:obj:`str`): The name of the bind, the default database is returned if not passed.
+        """
+        if bind is None:
+            return self.db
+
+        facade = self.__binds.get(bind)
+
+        if facade is None:
+            facade = self.__binds[bind] = DatabaseFacade()
+            facade.original.flask_pony_bind = bind
+
+            if self.app is not None:
+                self.__setup_database(self.app, facade.original)
+
+        return facade.original
+
+    @property
+    def cache(self):
+        """Returns the cache used by repositories, forms and views."""
+        if self.__cache is None:
+            config = self.__get_app().config
+            self.__cache = config['PONY_CACHE'] or MemoryCache(config['PONY_CACHE_SIZE'])
+        return self.__cache
+
+    @property
+    def query_sinks(self):
+        """Returns callables that receive the SQL statistics of each request."""
+        return self.__sinks
+
+    def add_query_sink(self, sink):
+        """
+        Adds a callable that receives the SQL statistics of each request,
+        it is called with two arguments: the application and the
+        :py:class:`~flask_pony.instrumentation.QueryStats` instance.
+        """
+        self.__sinks.append(sink)
+        return sink
+
+    @property
+    def slow_query_log(self):
+        """Returns the :py:class:`~flask_pony.slowlog.SlowQueryLog` or None if it is disabled."""
+        return self.__slow_log
+
+    @property
+    def stats(self):
+        """Returns the number of requests and how many of them opened the db_session."""
+        return self.__stats.as_dict()
+
     def connect(self):
+        """
+        Binds all databases and generates the mapping.
+
+        The tables are created if the ``PONY_CREATE_TABLES`` option is True
+        and checked if the ``PONY_CHECK_TABLES`` option is True,
+        otherwise the database is not accessed until the first query.
+        The time spent on each step is available in the :py:attr:`boot_timings` property.
+        """
+        config = self.__get_app().config
+        timings = self.__boot_timings = OrderedDict((step, 0.0) for step in ('bind', 'mapping', 'tables', 'forms'))
+        started = default_timer()
+
+        self.__connect_database(self.__facade, config['PONY'])
+
+        if config['PONY_REPLICAS']:
+            with _timing(timings, 'bind'):
+                provider = self.db.provider
+                provider.pool = RoutingPool(
+                    provider.pool,
+                    [create_replica_pool(config['PONY'], replica) for replica in config['PONY_REPLICAS']],
+                    config['PONY_REPLICA_STRATEGY'],
+                )
+
+        for bind in set(self.__binds) | set(config['PONY_BINDS']):
+            if bind not in config['PONY_BINDS']:
+                raise RuntimeError('The bind "{}" is not configured in PONY_BINDS.'.format(bind))
+
+            self.get_db(bind)
+            self.__connect_database(self.__binds[bind], config['PONY_BINDS'][bind])
+
+        pool_size = config['PONY_POOL_SIZE']
+
+        if pool_size is None and config['PONY_CONTEXT_LOCAL']:
+            pool_size = 10
+
+        if pool_size is not None:
+            for db in self.databases:
+                if db.provider.dialect == 'SQLite':
+                    raise RuntimeError('SQLite connections cannot be shared, '
+                                       'PONY_POOL_SIZE and PONY_CONTEXT_LOCAL require another database.')
+                use_session_pools(db.provider, pool_size)
+
+        if config['PONY_KEEPALIVE'] is not None:
+            for db in self.databases:
+                keep_alive(db.provider, config['PONY_KEEPALIVE'])
+
+        if config['PONY_PREBUILD_FORMS']:
+            with _timing(timings, 'forms'):
+                self.prebuild_forms()
+
+        timings['total'] = default_timer() - started
+
+        logger.info('Databases are connected in %.1f ms (%s)', timings['total'] * 1000, ', '.join(
+            '{} {:.1f} ms'.format(step, seconds * 1000) for step, seconds in timings.items() if step != 'total'
+        ))
+
+    def __connect_database(self, facade, options):
         config = self.__get_app().config
+        timings = self.__boot_timings
+        db = facade.original
+
+        with _timing(timings, 'bind'):
+            facade.bind(**options)
+
+        with _timing(timings, 'mapping'):
+            facade.connect(create_tables=False, check_tables=False)
+
+        with _timing(timings, 'tables'):
+            if config['PONY_CREATE_TABLES']:
+                db.create_tables(config['PONY_CHECK_TABLES'])
+            elif config['PONY_CHECK_TABLES']:
+                db.check_tables()
+
+    @property
+    def boot_timings(self):
+        """
+        Returns the time in seconds spent by :py:meth:`connect` on binding the databases,
+        generating the mapping, creating or checking the tables, building the forms and in total.
+        """
+        return dict(self.__boot_timings)
+
+    def post_fork(self):
+        """
+        Prepares the connections in the worker process of a prefork server (for example, gunicorn).
+
+        The method is not called automatically, call it from the hook of the server,
+        for example ``post_fork`` in the gunicorn config.
+
+        The connections inherited from the parent process are forgotten without closing,
+        and if the ``PONY_WARM_UP`` option is set, new connections to all databases and replicas
+        are opened and checked, so that the first requests do not wait for them.
+        The option is True (one connection) or the number of connections for each database,
+        more than one connection is kept only with ``PONY_POOL_SIZE``.
+        """
+        count = int(self.__get_app().config['PONY_WARM_UP'] or 0)
+
+        for db in self.databases:
+            if db.provider is None:
+                continue
+
+            if count:
+                warm_up(db, count)
+            else:
+                for pool in iter_pools(db.provider.pool):
+                    reset_pool(pool)
+
+    @property
+    def databases(self):
+        """Returns the default database and the databases of all binds."""
+        return [self.db] + [facade.original for facade in self.__binds.values()]
+
+    def prebuild_forms(self):
+        """
+        Builds the form classes of all registered views that generate forms,
+        so that the requests do not pay for it.
 
-        facade = self.__facade
-        facade.bind(**config['PONY'])
-        facade.connect()
+        The forms are built from the class attributes of the views, the views are not instantiated.
+        If the form of a view can not be built, a warning is logged and the view is skipped.
+
+        Must be called after the mapping is generated and all views are registered.
+        """
+        from .orm import FormBuilder
+        from .views import ProcessFormView
+
+        for view in self.__get_app().view_functions.values():
+            view_class = getattr(view, 'view_class', None)
+
+            if not view_class or not issubclass(view_class, ProcessFormView):
+                continue
+
+            builder = view_class.form_class
+
+            if not isinstance(builder, type) or not issubclass(builder, FormBuilder):
+                continue
+
+            try:
+                repository_class = view_class.repository_class
+                entity_class = repository_class.entity_class
+
+                if isinstance(entity_class, string_types):
+                    entity_class = self.get_db(getattr(repository_class, 'bind', None)).entities[entity_class]
+
+                builder.get_form_class(entity_class, view_class.form_base_class, view_class.form_excludes)
+            except Exception:
+                logger.warning('Unable to build the form of the view %s', view_class.__name__, exc_info=True)
+
+    def __setup_database(self, app, db):
+        """Installs the lazy session, change tracking and instrumentation hooks on the database."""
+        config = app.config
+
+        if config['PONY_LAZY_SESSION']:
+            db._get_cache = lazy_db_session(db._get_cache)
+
+        if config['PONY_TRACK_CHANGES']:
+            track_changes(db)
+
+        if config['PONY_INSTRUMENTATION']:
+            instrument_database(db)
+
+        if self.__slow_log is not None:
+            instrument_database(db, self.__slow_log)
 
     def init_app(self, app):
         self.app = app
         app.config.setdefault('PONY', {})
+        app.config.setdefault('PONY_BINDS', {})
+        app.config.setdefault('PONY_LAZY_SESSION', False)
+        app.config.setdefault('PONY_CONTEXT_LOCAL', False)
+        app.config.setdefault('PONY_POOL_SIZE', None)
+        app.config.setdefault('PONY_SESSION_POLICY', {})
+        app.config.setdefault('PONY_BLUEPRINT_SESSION_POLICY', {})
+        app.config.setdefault('PONY_PREBUILD_FORMS', False)
+        app.config.setdefault('PONY_CREATE_TABLES', True)
+        app.config.setdefault('PONY_CHECK_TABLES', True)
+        app.config.setdefault('PONY_CACHE', None)
+        app.config.setdefault('PONY_CACHE_SIZE', 1024)
+        app.config.setdefault('PONY_TRACK_CHANGES', True)
+        app.config.setdefault('PONY_TRACK_CHANGES_LIMIT', 100)
+        app.config.setdefault('PONY_TIMEZONE', None)
+        app.config.setdefault('PONY_REPLICAS', [])
+        app.config.setdefault('PONY_REPLICA_STRATEGY', 'round_robin')
+        app.config.setdefault('PONY_REPLICA_METHODS', ('GET', 'HEAD'))
+        app.config.setdefault('PONY_REPLICA_LAG', 5)
+        app.config.setdefault('PONY_KEEPALIVE', None)
+        app.config.setdefault('PONY_WARM_UP', True)
+        app.config.setdefault('PONY_INSTRUMENTATION', False)
+        app.config.setdefault('PONY_N_PLUS_ONE_THRESHOLD', 10)
+        app.config.setdefault('PONY_SERVER_TIMING', True)
+        app.config.setdefault('PONY_QUERY_SINKS', [])
+        app.config.setdefault('PONY_SLOW_QUERY_MS', None)
+        app.config.setdefault('PONY_SLOW_QUERY_SAMPLE_RATE', 1.0)
+        app.config.setdefault('PONY_SLOW_QUERY_DUMP_DIR', None)
+        app.config.setdefault('PONY_SLOW_QUERY_DUMP_INTERVAL', 60)
+
+        app.extensions['pony'] = self
+
+        if app.config['PONY_CONTEXT_LOCAL']:
+            install_context_local()
+
+        if not app.config['PONY_LAZY_SESSION']:
+            app.before_request(start_db_session)
+
+        if app.config['PONY_SLOW_QUERY_MS'] is not None:
+            self.__slow_log = SlowQueryLog(app.config['PONY_SLOW_QUERY_MS'],
+                                           app.config['PONY_SLOW_QUERY_SAMPLE_RATE'],
+                                           dump_dir=app.config['PONY_SLOW_QUERY_DUMP_DIR'],
+                                           dump_interval=app.config['PONY_SLOW_QUERY_DUMP_INTERVAL'])
+
+            if app.config['PONY_SLOW_QUERY_DUMP_DIR']:
+                @app.teardown_request
+                def dump_slow_queries(exc=None):
+                    self.__slow_log.maybe_dump()
+
+        self.__setup_database(app, self.db)
+
+        for facade in self.__binds.values():
+            self.__setup_database(app, facade.original)
+
+        if app.config['PONY_REPLICAS']:
+            route_writes(self.db)
+            app.after_request(pin_to_primary)
+
+        if app.config['PONY_INSTRUMENTATION']:
+            self.__sinks.extend(app.config['PONY_QUERY_SINKS'])
+
+            @app.after_request
+            def add_server_timing(response):
+                stats = get_query_stats()
+                if stats is not None and app.config['PONY_SERVER_TIMING']:
+                    response.headers.add('Server-Timing', stats.server_timing())
+                return response
+
+        app.cli.add_command(pony_cli)
 
-        app.before_request(start_db_session)
+        @app.teardown_request
+        def record_session_usage(exc=None):
+            self.__stats.record(db_session_used())
 
         @app.teardown_appcontext
         def shutdown_session(response_or_exc):
@@ -0,0 +1,271 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from threading import RLock
+from time import time
+
+from flask import current_app, g, has_app_context
+
+
+__all__ = (
+    'MemoryCache', 'get_cache', 'get_entity_version', 'entity_cache_key', 'instance_cache_key',
+    'invalidate_entity', 'record_change', 'track_changes',
+)
+
+
+class MemoryCache(object):
+    """
+    A thread-safe in-memory cache with the expiration time and the LRU eviction.
+
+    The interface is compatible with the `cachelib <https://github.com/pallets/cachelib>`_ caches,
+    so any of them (for example, ``RedisCache``) can be used instead to share the cache between processes.
+
+    Arguments:
+        maxsize (:obj:`int`): The maximum number of items in the cache.
+        default_timeout (:obj:`int`): The default expiration time in seconds, 0 means never expire.
+    """
+
+    def __init__(self, maxsize=1024, default_timeout=300):
+        self.__items = OrderedDict()
+        self.__lock = RLock()
+        self.maxsize = maxsize
+        self.default_timeout = default_timeout
+
+    def __expires(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        return time() + timeout if timeout > 0 else None
+
+    def get(self, key):
+        with self.__lock:
+            item = self.__items.get(key)
+
+            if item is None:
+                return None
+
+            value, expires = item
+
+            if expires is not None and expires <= time():
+                del self.__items[key]
+                return None
+
+            self.__items[key] = self.__items.pop(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self.__lock:
+            self.__items.pop(key, None)
+            self.__items[key] = (value, self.__expires(timeout))
+
+            while len(self.__items) > self.maxsize:
+                self.__items.popitem(last=False)
+
+        return True
+
+    def add(self, key, value, timeout=None):
+        with self.__lock:
+            if self.get(key) is not None:
+                return False
+            return self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self.__lock:
+            return self.__items.pop(key, None) is not None
+
+    def inc(self, key, delta=1):
+        with self.__lock:
+            value = (self.get(key) or 0) + delta
+            self.set(key, value, 0)
+            return value
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+        return True
+
+
+_default_cache = MemoryCache()
+
+
+def get_cache():
+    """Returns the cache of the current application or the default process cache."""
+    if has_app_context():
+        pony = current_app.extensions.get('pony')
+        if pony is not None:
+            return pony.cache
+    return _default_cache
+
+
+def _entity_name(entity_class):
+    """Returns the entity name prefixed with the name of its database bind, if it is not the default database."""
+    bind = getattr(getattr(entity_class, '_database_', None), 'flask_pony_bind', None)
+    return entity_class.__name__ if bind is None else '{}.{}'.format(bind, entity_class.__name__)
+
+
+def _version_key(entity_class, *parts):
+    key = ['flask_pony:version', _entity_name(entity_class)]
+    key.extend(str(p) for p in parts)
+    return ':'.join(key)
+
+
+def _get_version(cache, key):
+    version = cache.get(key)
+
+    if version is None:
+        cache.add(key, int(time() * 1000), 0)
+        version = cache.get(key)
+
+    return version
+
+
+def get_entity_version(entity_class, cache=None):
+    """
+    Returns the current version of the cached data of the entity class.
+
+    If the version is lost (for example, evicted from the cache),
+    a new one is generated from the current time, so the old keys are never reused.
+    """
+    return _get_version(cache or get_cache(), _version_key(entity_class))
+
+
+def entity_cache_key(entity_class, *parts):
+    """Returns the cache key that becomes invalid after the :py:func:`invalidate_entity` call."""
+    cache = get_cache()
+    key = [
+        'flask_pony',
+        _entity_name(entity_class),
+        str(get_entity_version(entity_class, cache)),
+    ]
+    key.extend(str(p) for p in parts)
+    return ':'.join(key)
+
+
+def instance_cache_key(entity_class, pk, *parts):
+    """
+    Returns the cache key of data of one entity instance.
+
+    The key becomes invalid after the :py:func:`invalidate_entity` call with the same primary key
+    or without the primary key, but changes of other instances do not affect it.
+    """
+    cache = get_cache()
+    pk = [str(v) for v in (pk if isinstance(pk, (tuple, list)) else (pk,))]
+    key = [
+        'flask_pony',
+        _entity_name(entity_class),
+        str(_get_version(cache, _version_key(entity_class, 'bulk'))),
+        str(_get_version(cache, _version_key(entity_class, 'pk', *pk))),
+    ]
+    key.extend(pk)
+    key.extend(str(p) for p in parts)
+    return ':'.join(key)
+
+
+def invalidate_entity(entity_class, pk=None, instances=True):
+    """
+    Invalidates the cached data of the entity class and its base classes.
+
+    The changed instances may belong to the subclasses (for example, after a bulk update of the base class),
+    so the data of the subclasses is invalidated too, unless ``instances`` is False.
+
+    Arguments:
+        entity_class (:py:class:`~Database.Entity`): The changed entity class.
+        pk (:obj:`tuple`): The primary key of the changed instance.
+            If not passed, the data of all instances is invalidated too.
+        instances (:obj:`bool`): If False, only the lists and counters are invalidated,
+            for example, when a new instance is created.
+    """
+    cache = get_cache()
+    classes = (entity_class,) + tuple(getattr(entity_class, '_all_bases_', ()))
+
+    if instances:
+        classes += tuple(getattr(entity_class, '_subclasses_', ()))
+
+    for cls in classes:
+        keys = [_version_key(cls)]
+
+        if pk is not None:
+            keys.append(_version_key(cls, 'pk', *pk))
+        elif instances:
+            keys.append(_version_key(cls, 'bulk'))
+
+        for key in keys:
+            _get_version(cache, key)
+            cache.inc(key)
+
+
+def record_change(entity_class, pk=None, instances=True):
+    """
+    Invalidates the cached data of the entity like :py:func:`invalidate_entity`,
+    but inside the db_session of a request it is postponed until the session ends, after the commit,
+    so that concurrent requests do not put the uncommitted data back to the cache.
+
+    The primary keys are remembered up to ``PONY_TRACK_CHANGES_LIMIT`` for each entity class,
+    after that the data of all instances of the class is invalidated.
+    """
+    if not has_app_context() or not g.get('_pony_session_used'):
+        invalidate_entity(entity_class, pk, instances)
+        return
+
+    changed = g.setdefault('_pony_changed', {})
+    pks = changed.setdefault(entity_class, set())
+
+    if pks is None:
+        return
+
+    if pk is None:
+        if instances:
+            changed[entity_class] = None
+    elif len(pks) < current_app.config.get('PONY_TRACK_CHANGES_LIMIT', 100):
+        pks.add(pk)
+    else:
+        changed[entity_class] = None
+
+
+def invalidate_changed():
+    """Invalidates the entities changed during the db_session of the current request."""
+    for entity_class, pks in g.pop('_pony_changed', {}).items():
+        if pks is None:
+            invalidate_entity(entity_class)
+        elif not pks:
+            invalidate_entity(entity_class, instances=False)
+
+        for pk in pks or ():
+            invalidate_entity(entity_class, pk)
+
+
+def track_changes(db):
+    """
+    Invalidates the cached data of entities saved by Pony, even if they were changed without the repository.
+
+    Inside the db_session of a request the entities are invalidated when the session ends, after the commit,
+    otherwise right after they are saved. New instances invalidate only the lists and counters.
+    """
+    after_save = db.Entity._after_save_
+
+    if getattr(after_save, '__pony_tracked__', False):
+        return
+
+    def _after_save_(obj, status):
+        if status == 'inserted':
+            record_change(obj.__class__, instances=False)
+        else:
+            record_change(obj.__class__, obj._get_raw_pkval_())
+
+        after_save(obj, status)
+
+    _after_save_.__pony_tracked__ = True
+    db.Entity._after_save_ = _after_save_
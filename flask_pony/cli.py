@@ -0,0 +1,63 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .slowlog import load_snapshots, summarize
+
+
+pony_cli = AppGroup('pony', help='Flask-Pony commands.')
+
+
+@pony_cli.command('slow-queries')
+@click.option('--top', 'limit', default=20, help='The number of statements to show.')
+@click.option('--dir', 'dump_dir', default=None, help='The dump directory, PONY_SLOW_QUERY_DUMP_DIR by default.')
+def slow_queries(limit, dump_dir):
+    """Shows statements with the largest total time saved by running workers."""
+    dump_dir = dump_dir or current_app.config.get('PONY_SLOW_QUERY_DUMP_DIR')
+
+    if not dump_dir:
+        raise click.UsageError('Set PONY_SLOW_QUERY_DUMP_DIR or pass the --dir option.')
+
+    rows = summarize(load_snapshots(dump_dir), limit)
+
+    if not rows:
+        click.echo('No statistics found in {}'.format(dump_dir))
+        return
+
+    click.echo('{:>8} {:>6} {:>10} {:>8} {:>8} {:>8}  {}'.format(
+        'count', 'slow', 'total ms', 'p50', 'p95', 'p99', 'statement'))
+
+    for row in rows:
+        click.echo('{count:>8} {slow:>6} {total:>10.1f} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}  {fingerprint}'.format(**row))
+
+
+@pony_cli.command('check-tables')
+@click.option('--create', is_flag=True, help='Create the missing tables.')
+def check_tables(create):
+    """Checks that the tables of all entities exist, use it when PONY_CHECK_TABLES is disabled."""
+    for db in current_app.extensions['pony'].databases:
+        try:
+            if create:
+                db.create_tables(check_tables=True)
+            else:
+                db.check_tables()
+        except Exception as e:
+            raise click.ClickException(str(e))
+
+    click.echo('The tables are OK.')
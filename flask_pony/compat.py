@@ -14,9 +14,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import sys
+
+from flask import has_request_context
 from six import PY2
 
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python < 3.7
+    ContextVar = None
+
+try:
+    from flask.globals import request_ctx
+except ImportError:  # Flask < 2.2
+    from flask import _request_ctx_stack
+    request_ctx = None
+
+
+#: Renames the file replacing the existing one on every platform.
+replace_file = getattr(os, 'replace', os.rename)
+
 
 def get_exc_info(exc):
     return sys.exc_info() if PY2 else (type(exc), exc, exc.__traceback__)
+
+
+def is_session_accessed():
+    """
+    Returns True if the session of the current request was used.
+
+    The session is taken from the request context without the ``session`` proxy,
+    because since Flask 3.1 getting the session through it marks the session as accessed.
+    """
+    if not has_request_context():
+        return False
+
+    ctx = request_ctx._get_current_object() if request_ctx is not None else _request_ctx_stack.top
+
+    session = ctx._session if hasattr(ctx, '_session') else ctx.session
+    return session is not None and getattr(session, 'accessed', True)
@@ -0,0 +1,92 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pony.orm import core
+
+from .compat import ContextVar
+
+
+__all__ = ('ContextLocal', 'ContextState', 'install_context_local')
+
+
+#: Pony's ``Local`` class without the thread-local base, the context variable already isolates it.
+ContextState = type(str('ContextState'), (object,), dict(
+    (name, value) for name, value in vars(core.Local).items() if name not in ('__dict__', '__weakref__', '__module__')
+))
+
+
+class ContextLocal(object):
+    """
+    The replacement of ``pony.orm.core.local`` that keeps the state of Pony
+    (the db_session counter, caches and the current session) in a context variable,
+    so that it is isolated between greenlets and asyncio tasks, not only between threads.
+    Pony's connections are kept per thread, so it requires :py:class:`~flask_pony.pooling.SessionPool`.
+
+    Greenlets and tasks inherit the context of their creator, therefore the state is replaced
+    with a new one when a db_session starts outside of another db_session:
+    concurrent sessions never share the state, but nested code still sees the session of its creator.
+    """
+
+    __slots__ = ('_ContextLocal__var',)
+
+    #: The attributes copied to the new state from the previous state of the context.
+    inherited = ('debug', 'show_values', 'current_user')
+
+    def __init__(self, name='pony_local'):
+        if ContextVar is None:
+            raise RuntimeError('The context-local state requires Python 3.7 or newer.')
+        object.__setattr__(self, '_ContextLocal__var', ContextVar(name))
+
+    def get_state(self):
+        """Returns the state of the current context."""
+        state = self.__var.get(None)
+
+        if state is None:
+            state = ContextState()
+            self.__var.set(state)
+
+        return state
+
+    def __new_state(self, state):
+        new_state = ContextState()
+
+        for name in self.inherited:
+            setattr(new_state, name, getattr(state, name))
+
+        self.__var.set(new_state)
+        return new_state
+
+    def __getattr__(self, name):
+        return getattr(self.get_state(), name)
+
+    def __setattr__(self, name, value):
+        state = self.get_state()
+
+        if value and name in ('db_session', 'db_context_counter'):
+            if state.db_session is None and not state.db_context_counter:
+                state = self.__new_state(state)
+
+        setattr(state, name, value)
+
+    def __delattr__(self, name):
+        delattr(self.get_state(), name)
+
+
+def install_context_local():
+    """Replaces ``pony.orm.core.local`` with :py:class:`ContextLocal` and returns it."""
+    if not isinstance(core.local, ContextLocal):
+        core.local = ContextLocal()
+    return core.local
@@ -14,17 +14,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from flask import g, has_app_context, url_for
 from flask_wtf import FlaskForm
-from pony.orm import ObjectNotFound
+from pony.orm import ObjectNotFound, select
 from pony.orm.core import Entity
-from wtforms import SelectMultipleField, SelectFieldBase
+from wtforms import SelectFieldBase
 from wtforms import widgets
 from wtforms.compat import text_type
 from wtforms.validators import ValidationError
 
+from .cache import entity_cache_key, get_cache, get_entity_version
+from .utils import get_sql_condition
+
 
 __all__ = (
-    'Form', 'EntityField',
+    'Form', 'EntityField', 'EntityMultipleField',
 )
 
 
@@ -32,6 +36,7 @@ class Form(FlaskForm):
     """Base class for all HTML forms that work with Pony entities."""
 
     _attr_names_ = {}
+    _unique_validator_ = None
 
     def __init__(self, *args, **kwargs):
         super(Form, self).__init__(*args, **kwargs)
@@ -47,15 +52,42 @@ class Form(FlaskForm):
         data = self.data
         return {name: data.get(name) for name in self._attr_names_}
 
+    def validate(self, *args, **kwargs):
+        valid = super(Form, self).validate(*args, **kwargs)
+
+        if self._unique_validator_ is not None:
+            valid = self._unique_validator_(self) and valid
+
+        return valid
+
 
 class EntityField(SelectFieldBase):
+    """
+    Select field for choosing the related entity.
+
+    Choices are stored as ``(pk_str, label)`` tuples and are selected once per request.
+    If ``cache_timeout`` is set, they are shared through the cache (see :py:func:`~flask_pony.cache.get_cache`)
+    and invalidated when entities are changed using the repository.
+
+    Arguments:
+        entity_class: The class of the related entity.
+        label_attr (:obj:`str`): The attribute used as the option label,
+            only the primary key and this column are selected.
+            If not set, the whole entities are selected and converted to the string.
+        cache_timeout (:obj:`int`): Time in seconds to keep choices in the shared cache.
+        search_endpoint (:obj:`str`): The endpoint of the :py:class:`~flask_pony.views.AutocompleteView`.
+            If set, only the selected entity is rendered and other options are loaded by the browser
+            from this endpoint, its URL is passed in the ``data-autocomplete-url`` attribute.
+    """
+
     # __slots__ = ('__pk', '__entity')
 
     PK_SEPARATOR = ';'
 
     widget = widgets.Select()
 
-    def __init__(self, entity_class, label=None, allow_empty=False, empty_text='', **kwargs):
+    def __init__(self, entity_class, label=None, allow_empty=False, empty_text='',
+                 label_attr=None, cache_timeout=None, search_endpoint=None, **kwargs):
         self.__pk = None
         self.__entity = None
 
@@ -63,15 +95,39 @@ class EntityField(SelectFieldBase):
         self.entity_class = entity_class
         self.allow_empty = allow_empty
         self.empty_text = empty_text
+        self.label_attr = label_attr
+        self.cache_timeout = cache_timeout
+        self.search_endpoint = search_endpoint
 
-    def pk2str(self, entity):
+    def __call__(self, **kwargs):
+        if self.search_endpoint:
+            kwargs.setdefault('data_autocomplete_url', url_for(self.search_endpoint))
+        return super(EntityField, self).__call__(**kwargs)
+
+    @classmethod
+    def pk2str(cls, entity):
         pk = (text_type(getattr(entity, attr.name)) for attr in entity._pk_attrs_)
-        return self.PK_SEPARATOR.join(pk)
+        return cls.PK_SEPARATOR.join(pk)
 
-    # def str2pk(self, s):
-    #     attrs = self.entity_class._pk_attrs_
-    #     values = s.split(self.PK_SEPARATOR)
-    #     return tuple(attr.py_type(value) for attr, value in zip(attrs, values))
+    def get_label(self, entity):
+        """Returns the option label for the entity."""
+        if self.label_attr:
+            return text_type(getattr(entity, self.label_attr))
+        return text_type(entity)
+
+    def str2pk(self, value):
+        """Converts the string or the sequence of values to the primary key tuple."""
+        if isinstance(value, text_type):
+            value = value.split(self.PK_SEPARATOR)
+        elif not isinstance(value, (tuple, list)):
+            value = (value,)
+
+        attrs = self.entity_class._pk_attrs_
+
+        if len(value) != len(attrs):
+            raise ValidationError('Not a valid choice')
+
+        return tuple(attr.py_type(value) for attr, value in zip(attrs, value))
 
     @property
     def data(self):
@@ -110,28 +166,72 @@ class EntityField(SelectFieldBase):
 
     @pk.setter
     def pk(self, value):
-        if isinstance(value, text_type):
-            value = value.split(self.PK_SEPARATOR)
-        elif not isinstance(value, (tuple, list)):
-            value = (value,)
-
-        attrs = self.entity_class._pk_attrs_
-
-        if len(value) != len(attrs):
-            raise ValidationError('Not a valid choice')
-
-        self.__pk = tuple(attr.py_type(value) for attr, value in zip(attrs, value))
+        self.__pk = self.str2pk(value)
 
     @pk.deleter
     def pk(self):
         self.__pk = None
 
+    def load_choices(self):
+        """
+        Selects choices from the database.
+
+        Returns:
+            list: ``(pk_str, label)`` tuples.
+        """
+        entity_class = self.entity_class
+        pk_attrs = entity_class._pk_attrs_
+        label_attr = self.label_attr
+
+        if label_attr and len(pk_attrs) == 1 and not pk_attrs[0].reverse:
+            pk_name = pk_attrs[0].name
+            rows = select((getattr(e, pk_name), getattr(e, label_attr)) for e in entity_class)[:]
+            return [(text_type(pk), text_type(label)) for pk, label in rows]
+
+        return [(self.pk2str(entity), text_type(entity)) for entity in entity_class.select()]
+
+    def get_choices(self):
+        """
+        Returns:
+            list: Cached ``(pk_str, label)`` tuples.
+        """
+        entity_class = self.entity_class
+
+        if self.cache_timeout is not None:
+            cache = get_cache()
+            key = entity_cache_key(entity_class, 'choices', self.label_attr or '')
+            choices = cache.get(key)
+
+            if choices is None:
+                choices = self.load_choices()
+                cache.set(key, choices, self.cache_timeout)
+
+            return choices
+
+        if not has_app_context():
+            return self.load_choices()
+
+        cache = g.setdefault('_pony_choices', {})
+        key = (entity_class, self.label_attr, get_entity_version(entity_class))
+
+        if key not in cache:
+            cache[key] = self.load_choices()
+
+        return cache[key]
+
     def iter_choices(self):
+        selected = self.pk2str(self.data) if self.data is not None else None
+
         if self.allow_empty:
-            yield ('', self.empty_text, self.data is None)
+            yield ('', self.empty_text, selected is None)
 
-        for entity in self.entity_class.select():
-            yield (self.pk2str(entity), text_type(entity), entity == self.data)
+        if self.search_endpoint:
+            if selected is not None:
+                yield (selected, self.get_label(self.data), True)
+            return
+
+        for pk, label in self.get_choices():
+            yield (pk, label, pk == selected)
 
     def process_formdata(self, valuelist):
         if valuelist:
@@ -140,3 +240,97 @@ class EntityField(SelectFieldBase):
     def pre_validate(self, form):
         if self.data is None and (self.pk or not self.allow_empty):
             raise ValidationError('Not a valid choice')
+
+
+class EntityMultipleField(EntityField):
+    """
+    Multiple select field for the collection of related entities.
+
+    All submitted primary keys are resolved with a single query.
+    Accepts the same arguments as the :py:class:`EntityField`.
+    """
+
+    widget = widgets.Select(multiple=True)
+
+    def __init__(self, entity_class, label=None, **kwargs):
+        self.__entities = []
+        self.__invalid = False
+        super(EntityMultipleField, self).__init__(entity_class, label, **kwargs)
+
+    def load_entities(self, pks):
+        """
+        Selects entities by primary keys with a single query:
+        ``IN (...)`` for a simple primary key, OR-ed conditions for a composite one.
+
+        Arguments:
+            pks (:obj:`list`): Primary key tuples.
+        """
+        entity_class = self.entity_class
+        pk_attrs = entity_class._pk_attrs_
+
+        if len(pk_attrs) == 1 and not pk_attrs[0].reverse:
+            pk_name = pk_attrs[0].name
+            values = [pk[0] for pk in pks]
+            return entity_class.select(lambda e: getattr(e, pk_name) in values)[:]
+
+        names = [attr.name for attr in pk_attrs]
+        params = {}
+        where = ' OR '.join(
+            '({})'.format(get_sql_condition(entity_class, dict(zip(names, pk)), params, discriminate=False))
+            for pk in pks
+        )
+        sql = 'SELECT * FROM {} WHERE ({}) AND {}'.format(
+            entity_class._database_.provider.quote_name(entity_class._table_), where,
+            get_sql_condition(entity_class, {}, params))
+
+        return entity_class.select_by_sql(sql, params)
+
+    @property
+    def data(self):
+        return self.__entities
+
+    @data.setter
+    def data(self, values):
+        self.__invalid = False
+        entities = []
+        pks = set()
+
+        for value in values or ():
+            if isinstance(value, self.entity_class):
+                entities.append(value)
+            elif value is not None and value != '':
+                pks.add(self.str2pk(value))
+
+        if pks:
+            loaded = self.load_entities(list(pks))
+            self.__invalid = len(loaded) != len(pks)
+            entities.extend(loaded)
+
+        self.__entities = entities
+
+    @data.deleter
+    def data(self):
+        self.__entities = []
+        self.__invalid = False
+
+    @property
+    def pk(self):
+        return None
+
+    def iter_choices(self):
+        selected = set(self.pk2str(entity) for entity in self.data)
+
+        if self.search_endpoint:
+            for entity in self.data:
+                yield (self.pk2str(entity), self.get_label(entity), True)
+            return
+
+        for pk, label in self.get_choices():
+            yield (pk, label, pk in selected)
+
+    def process_formdata(self, valuelist):
+        self.data = valuelist
+
+    def pre_validate(self, form):
+        if self.__invalid:
+            raise ValidationError('Not a valid choice')
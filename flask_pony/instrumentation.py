@@ -0,0 +1,146 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from functools import wraps
+from time import time
+
+from flask import current_app, g, has_app_context
+
+from .signals import queries_executed
+
+
+__all__ = ('QueryStats', 'instrument_database', 'get_query_stats', 'record_query_stats')
+
+
+class QueryStats(object):
+    """
+    SQL statistics of one request.
+
+    Attributes:
+        count (:obj:`int`): The number of executed statements.
+        duration (:obj:`float`): The total execution time in seconds.
+        statements (:obj:`dict`): The SQL statement -> [count, duration].
+    """
+
+    __slots__ = ('count', 'duration', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+
+        stat = self.statements.get(sql)
+
+        if stat is None:
+            self.statements[sql] = [1, duration]
+        else:
+            stat[0] += 1
+            stat[1] += duration
+
+    def repeated(self, threshold):
+        """
+        Returns statements executed at least threshold times, which is usually the N+1 problem.
+
+        Returns:
+            list: Pairs (SQL statement, count) sorted by count in descending order.
+        """
+        result = [(sql, stat[0]) for sql, stat in self.statements.items() if stat[0] >= threshold]
+        result.sort(key=lambda item: item[1], reverse=True)
+        return result
+
+    def server_timing(self):
+        """Returns the value of the Server-Timing header."""
+        return 'db;dur={:.2f};desc="{} queries"'.format(self.duration * 1000, self.count)
+
+    def as_dict(self, threshold=None):
+        data = {
+            'count': self.count,
+            'duration': self.duration,
+        }
+
+        if threshold:
+            data['repeated'] = self.repeated(threshold)
+
+        return data
+
+
+def get_query_stats():
+    """Returns the :py:class:`QueryStats` of the current request or None if the instrumentation is disabled."""
+    if has_app_context():
+        return g.get('_pony_query_stats')
+    return None
+
+
+def start_query_stats():
+    """Starts collecting statistics for the current request."""
+    if current_app.config.get('PONY_INSTRUMENTATION'):
+        g._pony_query_stats = QueryStats()
+
+
+def report_query_stats(stats):
+    """Sends the statistics of the finished db_session to the signal and the sinks of the extension."""
+    app = current_app._get_current_object()
+    threshold = app.config.get('PONY_N_PLUS_ONE_THRESHOLD')
+
+    for sql, count in stats.repeated(threshold) if threshold else ():
+        app.logger.warning('Possible N+1 problem, the statement was executed %d times: %s', count, sql)
+
+    queries_executed.send(app, stats=stats)
+
+    pony = app.extensions.get('pony')
+
+    for sink in pony.query_sinks if pony is not None else ():
+        sink(app, stats)
+
+
+def record_query_stats(sql, duration):
+    """Adds the executed statement to the statistics of the current request."""
+    stats = get_query_stats()
+
+    if stats is not None:
+        stats.record(sql, duration)
+
+
+def instrument_database(db, listener=record_query_stats):
+    """
+    Wraps the :py:meth:`Database._update_local_stat` method,
+    Pony calls it after each executed statement.
+
+    The listener is called with the SQL statement and its execution time in seconds.
+    """
+    update_local_stat = db._update_local_stat
+    listeners = getattr(update_local_stat, '__pony_listeners__', None)
+
+    if listeners is None:
+        listeners = []
+
+        @wraps(update_local_stat)
+        def wrapper(sql, query_start_time):
+            update_local_stat(sql, query_start_time)
+            duration = time() - query_start_time
+
+            for func in listeners:
+                func(sql, duration)
+
+        wrapper.__pony_listeners__ = listeners
+        db._update_local_stat = wrapper
+
+    if listener not in listeners:
+        listeners.append(listener)
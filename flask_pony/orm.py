@@ -18,7 +18,7 @@ import six
 import wtforms.fields as wtf_fields
 import wtforms.validators as wtf_validators
 
-from .forms import Form, EntityField
+from .forms import Form, EntityField, EntityMultipleField
 from . import validators
 
 
@@ -42,6 +42,9 @@ class Factory(object):
 class FormBuilder(object):
     field_constructor = Factory()
 
+    # Process-wide cache of the built form classes.
+    _forms_cache = {}
+
     def __init__(self, entity_class, base_class=None, excludes=None, skip_pk=True):
         self._fields = OrderedDict()
         self._buttons = OrderedDict()
@@ -71,18 +74,24 @@ class FormBuilder(object):
         return method
 
     def _create_collection_field(self, attr, options):
-        """Creates the form element for working with the collection of entities."""
-        return None, options
+        """
+        Creates the form element for working with the collection of entities.
+
+        The element is not created for one-to-many relationships with the required reverse attribute,
+        because entities removed from the collection can not exist without the owner.
+        """
+        reverse = attr.reverse
+
+        if not reverse.is_collection and reverse.is_required:
+            return None, options
+
+        options['entity_class'] = attr.py_type
+        return EntityMultipleField, options
 
     def _create_plain_field(self, attr, options):
         """Creates the form element."""
         method = self._get_field_method(attr.py_type) or self._create_other_field
-        klass, options = method(attr, options)
-
-        if attr.is_unique:
-            options['validators'].append(validators.UniqueEntityValidator(attr.entity))
-
-        return klass, options
+        return method(attr, options)
 
     def _create_pk_field(self, attr, options):
         """Creates the form element for working with primary key."""
@@ -150,8 +159,21 @@ class FormBuilder(object):
         props.update(self._buttons)
         form = type(classname, (base,), props)
         form._attr_names_ = self._fields.keys()
+
+        keys = self.get_unique_keys()
+        if keys:
+            form._unique_validator_ = validators.UniqueKeysValidator(self._entity_class, keys)
+
         return form
 
+    def get_unique_keys(self):
+        """Returns unique keys of the entity (tuples of attribute names) whose attributes are all in the form."""
+        return [
+            tuple(attr.name for attr in key)
+            for key in self._entity_class._keys_
+            if all(attr.name in self._fields for attr in key)
+        ]
+
     @field_constructor(bool)
     def field_bool(self, attr, options):
         return wtf_fields.BooleanField, options
@@ -203,3 +225,26 @@ class FormBuilder(object):
     @classmethod
     def get_instance(cls, entity_class, *args, **kwargs):
         return cls(entity_class, *args, **kwargs).get_form()
+
+    @classmethod
+    def get_form_class(cls, entity_class, base_class=None, excludes=None, skip_pk=True):
+        """
+        Returns the form class for the entity class.
+
+        The form class is built only once, then it is taken from the cache.
+        The cache key is the entity class, the builder class, the base class of the form,
+        excluded attributes and the skip_pk flag.
+        """
+        key = (entity_class, cls, base_class, frozenset(excludes or ()), skip_pk)
+        form = cls._forms_cache.get(key)
+
+        if form is None:
+            form = cls.get_instance(entity_class, base_class, excludes, skip_pk)
+            form = cls._forms_cache.setdefault(key, form)
+
+        return form
+
+    @classmethod
+    def clear_cache(cls):
+        """Removes all built form classes from the cache."""
+        cls._forms_cache.clear()
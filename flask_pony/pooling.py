@@ -0,0 +1,269 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+from threading import Lock
+from time import time
+
+from pony.orm.dbapiprovider import Pool
+
+from .routing import RoutingPool
+
+
+__all__ = (
+    'KeepalivePool', 'SessionPool', 'iter_pools', 'keep_alive', 'ping', 'reset_pool', 'use_session_pools',
+    'warm_up',
+)
+
+
+logger = logging.getLogger('flask_pony.pooling')
+
+
+def iter_pools(pool):
+    """Yields the pools that hold connections, including the pools of replicas."""
+    pools = [pool.primary] + pool.replicas if isinstance(pool, RoutingPool) else [pool]
+
+    for pool in pools:
+        yield pool.pool if isinstance(pool, KeepalivePool) else pool
+
+
+def ping(provider, con):
+    """Checks that the connection is alive by executing the simplest query."""
+    cursor = con.cursor()
+    cursor.execute('SELECT 1 FROM DUAL' if provider.dialect == 'Oracle' else 'SELECT 1')
+    cursor.fetchone()
+    con.rollback()
+
+
+def reset_pool(pool):
+    """
+    Forgets the connections opened by the parent process.
+
+    The connections are not closed: closing them would terminate the sessions of the parent process,
+    which uses the same sockets. Returns True if any connection was forgotten.
+    """
+    if isinstance(pool, SessionPool):
+        return pool.reset()
+
+    con = getattr(pool, 'con', None)
+
+    if con is None or getattr(pool, 'pid', None) == os.getpid():
+        return False
+
+    Pool.forked_connections.append((con, pool.pid))
+    pool.con = pool.pid = None
+    return True
+
+
+def warm_up(db, count=1):
+    """
+    Opens and checks the connections to the database and its replicas,
+    so that the first requests do not wait for the connection.
+
+    Pony's own pool keeps one connection of the current thread,
+    :py:class:`SessionPool` keeps up to ``maxsize`` connections for any thread.
+
+    Arguments:
+        db: The Pony database.
+        count (:obj:`int`): The number of connections to each database, is used only with :py:class:`SessionPool`.
+
+    Returns the number of ready connections.
+    """
+    provider = db.provider
+    ready = 0
+
+    for pool in iter_pools(provider.pool):
+        reset_pool(pool)
+        opened = []
+
+        for _ in range(min(count, pool.maxsize) if isinstance(pool, SessionPool) else 1):
+            try:
+                con = pool.connect()[0]
+            except Exception:
+                logger.warning('Unable to open a connection to the database', exc_info=True)
+                break
+
+            try:
+                ping(provider, con)
+            except Exception:
+                logger.warning('The new connection to the database is broken', exc_info=True)
+                _drop(pool, con)
+            else:
+                opened.append(con)
+
+        for con in opened:
+            pool.release(con)
+
+        ready += len(opened)
+
+    return ready
+
+
+def keep_alive(provider, interval):
+    """Wraps the pools of the database and its replicas with :py:class:`KeepalivePool`."""
+    pool = provider.pool
+
+    if isinstance(pool, RoutingPool):
+        pool.primary = KeepalivePool(pool.primary, provider, interval)
+        pool.replicas = [KeepalivePool(replica, provider, interval) for replica in pool.replicas]
+    else:
+        provider.pool = KeepalivePool(pool, provider, interval)
+
+
+def use_session_pools(provider, maxsize):
+    """Replaces the pools of the database and its replicas with :py:class:`SessionPool`."""
+    pool = provider.pool
+
+    if isinstance(pool, RoutingPool):
+        pool.primary = SessionPool(pool.primary, maxsize)
+        pool.replicas = [SessionPool(replica, maxsize) for replica in pool.replicas]
+    else:
+        provider.pool = SessionPool(pool, maxsize)
+
+
+def _drop(pool, con):
+    try:
+        pool.drop(con)
+    except Exception:
+        pass
+
+
+class SessionPool(object):
+    """
+    The connection pool shared by all threads, greenlets and asyncio tasks of the process.
+
+    Pony keeps one connection for each thread, so concurrent db_sessions in one thread would share
+    a connection and a transaction. This pool gives each db_session its own connection
+    and takes it back when the db_session ends.
+
+    Arguments:
+        pool: The Pony pool that opens new connections.
+        maxsize (:obj:`int`): The maximum number of idle connections, the rest are closed when released.
+    """
+
+    def __init__(self, pool, maxsize=10):
+        self.pool = pool
+        self.maxsize = maxsize
+
+        self.__lock = Lock()
+        self.__idle = []
+        self.__pid = os.getpid()
+
+    @property
+    def idle(self):
+        """The number of idle connections."""
+        return len(self.__idle)
+
+    def reset(self):
+        """Forgets the idle connections if they were opened by the parent process."""
+        with self.__lock:
+            if self.__pid == os.getpid():
+                return False
+
+            Pool.forked_connections.extend((con, self.__pid) for con in self.__idle)
+            self.__idle = []
+            self.__pid = os.getpid()
+            return True
+
+    def open(self):
+        """Opens a new connection using the Pony pool."""
+        pool = self.pool
+        pool._connect()
+        con, pool.con = pool.con, None
+        return con
+
+    def connect(self):
+        self.reset()
+
+        with self.__lock:
+            con = self.__idle.pop() if self.__idle else None
+
+        if con is not None:
+            return con, False
+
+        return self.open(), True
+
+    def release(self, con):
+        """Returns the connection to the pool, returns False if it was closed because the pool is full."""
+        try:
+            con.rollback()
+        except Exception:
+            self.drop(con)
+            raise
+
+        with self.__lock:
+            if len(self.__idle) < self.maxsize and self.__pid == os.getpid():
+                self.__idle.append(con)
+                return True
+
+        con.close()
+        return False
+
+    def drop(self, con):
+        con.close()
+
+    def disconnect(self):
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+
+        for con in idle:
+            con.close()
+
+
+class KeepalivePool(object):
+    """
+    The connection pool of the Pony provider that checks the connection before the use
+    if it has been idle longer than the interval, and reconnects if the connection is lost
+    (for example, closed by the server or a firewall).
+
+    Arguments:
+        pool: The wrapped pool.
+        provider: The Pony provider of the database.
+        interval (:obj:`int`): The idle time in seconds after which the connection is checked.
+    """
+
+    def __init__(self, pool, provider, interval):
+        self.pool = pool
+        self.provider = provider
+        self.interval = interval
+        self.__released = {}
+
+    def connect(self):
+        con, is_new_connection = self.pool.connect()
+        released = self.__released.pop(id(con), None)
+
+        if not is_new_connection and released is not None and time() - released > self.interval:
+            try:
+                ping(self.provider, con)
+            except Exception:
+                logger.info('The idle connection to the database is lost, reconnecting', exc_info=True)
+                _drop(self.pool, con)
+                con, is_new_connection = self.pool.connect()
+
+        return con, is_new_connection
+
+    def release(self, con):
+        if self.pool.release(con) is not False:
+            self.__released[id(con)] = time()
+
+    def drop(self, con):
+        self.__released.pop(id(con), None)
+        self.pool.drop(con)
+
+    def disconnect(self):
+        self.__released.clear()
+        self.pool.disconnect()
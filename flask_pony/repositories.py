@@ -15,10 +15,19 @@
 # limitations under the License.
 
 from abc import ABCMeta, abstractmethod
-import pickle
+from collections import namedtuple
+from itertools import islice
+from math import ceil
+from numbers import Number
 
-from pony.orm import ObjectNotFound, flush
-from six import with_metaclass
+from flask import current_app
+from pony.orm import ObjectNotFound, count, db_session, desc, flush, select
+from pony.orm.core import DEFAULT
+from six import string_types, with_metaclass
+
+from .cache import entity_cache_key, get_cache, instance_cache_key, record_change
+from .routing import use_primary
+from .utils import get_db_values, get_sql_condition, get_sql_params
 
 
 class Repository(with_metaclass(ABCMeta)):
@@ -68,15 +77,183 @@ class Repository(with_metaclass(ABCMeta)):
         """
 
 
+class Page(object):
+    """
+    One page of entities.
+
+    Attributes:
+        items (:obj:`list`): Entities on the page.
+        page (:obj:`int`): The page number, is None for the keyset pagination.
+        per_page (:obj:`int`): The maximum number of entities on the page.
+        total (:obj:`int`): The total number of entities or None if it was not counted.
+        has_next (:obj:`bool`): True if there is a next page.
+        next_cursor: The value of the ordering attribute of the last entity on the page,
+            is used to get the next page with the keyset pagination.
+    """
+
+    def __init__(self, items, page, per_page, total=None, has_next=False, next_cursor=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def pages(self):
+        """The total number of pages or None if the total number of entities is unknown."""
+        if self.total is None:
+            return None
+        return max(int(ceil(self.total / float(self.per_page))), 1)
+
+    @property
+    def has_prev(self):
+        return bool(self.page and self.page > 1)
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.page and self.has_next else None
+
+
+class EntitySnapshot(object):
+    """
+    Read-only proxy of an entity restored from the values saved in the cache.
+
+    Column values are read from the snapshot, related entities are loaded by their primary keys
+    on access. Other attributes (collections, lazy attributes and methods) are taken from the entity
+    loaded from the database, so they require a db_session.
+    Private and special names (for example, ``__html__`` probed by Jinja) are not taken from the entity.
+
+    Snapshots are compared and hashed by the entity class hierarchy and the primary key,
+    they are not equal to entities, because entities are compared by identity.
+    """
+
+    __slots__ = ('_entity_class_', '_values_', '_entity_')
+
+    def __init__(self, entity_class, values):
+        object.__setattr__(self, '_entity_class_', entity_class)
+        object.__setattr__(self, '_values_', values)
+        object.__setattr__(self, '_entity_', None)
+
+    @classmethod
+    def dump(cls, entity):
+        """Returns the values of the entity columns that can be saved in the cache."""
+        values = {}
+
+        for attr in entity._attrs_:
+            if attr.is_collection or attr.lazy:
+                continue
+
+            value = getattr(entity, attr.name)
+
+            if attr.is_relation and value is not None:
+                value = value._get_raw_pkval_()
+
+            values[attr.name] = value
+
+        return entity.__class__.__name__, values
+
+    def get_pk(self):
+        pk = tuple(self._values_[attr.name] for attr in self._entity_class_._pk_attrs_)
+        return pk[0] if len(pk) == 1 else pk
+
+    def get_entity(self):
+        """Returns the entity loaded from the database."""
+        if self._entity_ is None:
+            pk = tuple(self._values_[attr.name] for attr in self._entity_class_._pk_attrs_)
+            object.__setattr__(self, '_entity_', self._entity_class_[pk])
+        return self._entity_
+
+    def __getattr__(self, name):
+        values = self._values_
+
+        if name not in values:
+            if name.startswith('_'):
+                raise AttributeError(name)
+
+            return getattr(self.get_entity(), name)
+
+        value = values[name]
+        attr = self._entity_class_._adict_[name]
+
+        if attr.is_relation and value is not None:
+            return attr.py_type[value]
+
+        return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError('The cached entity is read-only, load it with cached=False to change it.')
+
+    def _get_raw_pkval_(self):
+        raw = []
+
+        for attr in self._entity_class_._pk_attrs_:
+            value = self._values_[attr.name]
+
+            if attr.is_relation:
+                raw.extend(value)
+            else:
+                raw.append(value)
+
+        return tuple(raw)
+
+    def _get_identity_(self):
+        return self._entity_class_._root_, self._get_raw_pkval_()
+
+    def __eq__(self, other):
+        if isinstance(other, EntitySnapshot):
+            return self._get_identity_() == other._get_identity_()
+
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(self._get_identity_())
+
+    def __repr__(self):
+        return '{}[{!r}] (cached)'.format(self._entity_class_.__name__, self.get_pk())
+
+
+_row_classes = {}
+
+
 class PonyRepository(Repository):
     """
     Repository for working with Pony entities.
 
     Attributes:
-        entity_class (:py:class:`~Database.Entity`): A reference to the entity class.
+        entity_class (:py:class:`~Database.Entity`): A reference to the entity class
+            or its name in the database of the :py:attr:`bind`.
+        bind (:obj:`str`): The name of the database bind (``PONY_BINDS``) used to find the entity class by name.
+        count_cache_timeout (:obj:`int`):
+            If set, the result of the :py:meth:`count` method is cached for the specified number of seconds.
+        cache_timeout (:obj:`int`):
+            If set, the :py:meth:`get` method keeps the entity values in the cache for the specified number
+            of seconds and returns read-only :py:class:`EntitySnapshot` proxies.
     """
 
     entity_class = None
+    bind = None
+    count_cache_timeout = None
+    cache_timeout = None
+
+    def __init__(self):
+        if isinstance(self.entity_class, string_types):
+            db = current_app.extensions['pony'].get_db(self.bind)
+            self.entity_class = db.entities[self.entity_class]
 
     def get_entity_class(self):
         """
@@ -87,38 +264,689 @@ class PonyRepository(Repository):
             raise AttributeError('You must assign the value of the attribute "entity_class".')
         return self.entity_class
 
+    def get_ordering(self, order_by=None):
+        """
+        Returns a list of pairs (entity attribute, descending flag).
+
+        Arguments:
+            order_by (:obj:`str` or :obj:`tuple`): Attribute names, the "-" prefix means descending order.
+                Entities are sorted by the primary key by default.
+        """
+        entity_class = self.get_entity_class()
+
+        if order_by is None:
+            return [(attr, False) for attr in entity_class._pk_attrs_]
+
+        if isinstance(order_by, string_types):
+            order_by = (order_by,)
+
+        return [(entity_class._adict_[name.lstrip('-')], name.startswith('-')) for name in order_by]
+
+    def count(self):
+        """
+        Returns the number of entities.
+
+        The result is cached if the :py:attr:`count_cache_timeout` attribute is set.
+        """
+        entity_class = self.get_entity_class()
+
+        if self.count_cache_timeout is None:
+            return entity_class.select().count()
+
+        cache = get_cache()
+        key = entity_cache_key(entity_class, 'count')
+        value = cache.get(key)
+
+        if value is None:
+            value = entity_class.select().count()
+            cache.set(key, value, self.count_cache_timeout)
+
+        return value
+
     def create(self, **attributes):
         entity = self.entity_class(**attributes)
         flush()
+        record_change(entity.__class__, instances=False)
         return entity
 
+    def create_many(self, rows, batch_size=1000, raw=False):
+        """
+        Creates entities from the dictionaries of attribute values in batches.
+
+        Each batch is created in its own strict db_session, so it is flushed and committed once,
+        and the session cache is cleared between batches.
+        If called inside another db_session, the nested sessions are ignored:
+        each batch is only flushed and the cache is not cleared.
+
+        Arguments:
+            rows (iterable): Dictionaries with attribute values, may be a generator.
+            batch_size (:obj:`int`): The number of entities in one batch.
+            raw (:obj:`bool`): Insert rows with multi-row INSERT statements without creating entities.
+                It is much faster, but the entity hooks are not called and the values are only
+                converted and validated by the attributes, composite keys and relations are not checked.
+                If called inside another db_session, collections of related entities already loaded
+                in it do not contain the inserted rows. An auto-incremented primary key
+                must be passed in all rows of a batch or in none of them.
+
+        Returns:
+            int: The number of created entities.
+        """
+        entity_class = self.get_entity_class()
+        rows = iter(rows)
+        created = 0
+
+        while True:
+            batch = list(islice(rows, batch_size))
+
+            if not batch:
+                break
+
+            with db_session(strict=True):
+                if raw:
+                    self._insert_rows(batch)
+                else:
+                    for attributes in batch:
+                        entity_class(**attributes)
+                    flush()
+
+            created += len(batch)
+
+        if created:
+            record_change(entity_class, instances=False)
+
+        return created
+
+    def _insert_rows(self, rows):
+        """Inserts the rows with multi-row INSERT statements."""
+        entity_class = self.get_entity_class()
+        db = entity_class._database_
+        quote_name = db.provider.quote_name
+
+        names = set(name for row in rows for name in row)
+
+        for attr in entity_class._attrs_:
+            if attr.auto and attr.name in names and not all(attr.name in row for row in rows):
+                raise ValueError('The attribute {}.{} must be passed in all rows or in none of them.'.format(
+                    entity_class.__name__, attr.name))
+
+        attrs = [
+            attr for attr in entity_class._attrs_
+            if attr.columns and not attr.is_collection and not (attr.auto and attr.name not in names)
+        ]
+        unknown = names - set(attr.name for attr in attrs)
+
+        if unknown:
+            raise TypeError('Unknown attributes of the entity {}: {}'.format(
+                entity_class.__name__, ', '.join(sorted(unknown))))
+
+        columns = [quote_name(column) for attr in attrs for column in attr.columns]
+        per_statement = max(1, 999 // len(columns))
+        flush()
+        use_primary(db)
+
+        for start in range(0, len(rows), per_statement):
+            params = {}
+            values = []
+
+            for row in rows[start:start + per_statement]:
+                placeholders = []
+
+                for attr in attrs:
+                    if attr.is_discriminator:
+                        value = row.get(attr.name, entity_class._discriminator_)
+                    else:
+                        value = row.get(attr.name, None if attr.reverse else DEFAULT)
+
+                    for dbval in get_db_values(attr, value):
+                        key = 'p{}'.format(len(params))
+                        params[key] = dbval
+                        placeholders.append('${}'.format(key))
+
+                values.append('({})'.format(', '.join(placeholders)))
+
+            sql = 'INSERT INTO {} ({}) VALUES {}'.format(
+                quote_name(entity_class._table_), ', '.join(columns), ', '.join(values))
+            self._execute(sql, params)
+
+    def _execute(self, sql, params):
+        """
+        Executes the statement that changes rows bypassing the entities and returns the cursor.
+
+        Pony does not know which rows are changed, so the cached query results of the db_session are cleared.
+        """
+        db = self.get_entity_class()._database_
+        cursor = db.execute(sql, params)
+        db._get_cache().query_results.clear()
+        return cursor
+
     def delete(self, entity):
         assert isinstance(entity, self.entity_class)
+        pk = entity._get_raw_pkval_()
         entity.delete()
         flush()
+        record_change(entity.__class__, pk)
 
-    def get(self, *pk):
+    def get_prefetch_attrs(self, prefetch):
+        """
+        Converts relation names to entity attributes for the :py:meth:`Query.prefetch` method.
+
+        Arguments:
+            prefetch (:obj:`tuple`): Attribute names, nested relations are separated by a dot,
+                for example ``('author', 'tags', 'author.country')``.
+
+        Returns:
+            list: Attributes of the entity classes.
+        """
+        attrs = []
+
+        for path in prefetch or ():
+            entity_class = self.get_entity_class()
+
+            for name in path.split('.'):
+                attr = entity_class._adict_[name]
+                if attr not in attrs:
+                    attrs.append(attr)
+                entity_class = attr.py_type
+
+        return attrs
+
+    def get_query(self, prefetch=None):
+        """
+        Returns the query of all entities.
+
+        Arguments:
+            prefetch (:obj:`tuple`): Relations loaded in bulk together with the entities,
+                see :py:meth:`get_prefetch_attrs`.
+        """
+        query = self.get_entity_class().select()
+
+        if prefetch:
+            query = query.prefetch(*self.get_prefetch_attrs(prefetch))
+
+        return query
+
+    def get_row_class(self, fields):
+        """Returns the namedtuple class for rows with the given attribute names."""
+        key = (self.get_entity_class(), tuple(fields))
+        row_class = _row_classes.get(key)
+
+        if row_class is None:
+            row_class = _row_classes[key] = namedtuple('{}Row'.format(key[0].__name__), fields)
+
+        return row_class
+
+    def get_fields_query(self, fields, order_by=None):
+        """
+        Returns the query of tuples with the values of the attributes,
+        only their columns are selected and the entities are not loaded into the db_session.
+
+        Arguments:
+            fields (:obj:`tuple`): Attribute names, collections are not supported.
+            order_by (:obj:`str` or :obj:`tuple`): Attribute names, see :py:meth:`get_ordering`.
+        """
+        entity_class = self.get_entity_class()
+
+        for name in fields:
+            attr = entity_class._adict_.get(name)
+            if attr is None or attr.is_collection:
+                raise ValueError('The attribute "{}" can not be selected as a field.'.format(name))
+
+        query = select('({}) for e in entity_class'.format(', '.join('e.' + name for name in fields)),
+                       {'entity_class': entity_class}, {})
+
+        ordering = ', '.join(
+            'desc(e.{})'.format(attr.name) if descending else 'e.' + attr.name
+            for attr, descending in self.get_ordering(order_by)
+        )
+
+        return query.order_by(ordering)
+
+    def make_rows(self, fields, values):
+        """Converts the result of the :py:meth:`get_fields_query` to a list of namedtuples."""
+        row_class = self.get_row_class(fields)
+
+        if len(fields) == 1:
+            return [row_class(v) for v in values]
+
+        return [row_class(*v) for v in values]
+
+    def get(self, *pk, **kwargs):
         """
         Return an entity instance selected by its primary key.
         Raises the ObjectNotFound exception if there is no such object.
+
+        Arguments:
+            prefetch (:obj:`tuple`): Relations loaded together with the entity, see :py:meth:`get_prefetch_attrs`.
+                The cache is not used if set.
+            cached (:obj:`bool`): Use the cache if the :py:attr:`cache_timeout` attribute is set.
+                Pass False to get the entity that can be changed or deleted.
         """
-        return self.entity_class.__getitem__(pk)
+        prefetch = kwargs.pop('prefetch', None)
+        cached = kwargs.pop('cached', True)
 
-    def get_all(self):
-        return self.entity_class.select()[:]
+        if cached and not prefetch and self.cache_timeout is not None:
+            return self.get_cached(*pk)
+
+        if not prefetch:
+            return self.entity_class.__getitem__(pk)
+
+        query = self.get_query(prefetch)
+
+        for attr, value in zip(self.entity_class._pk_attrs_, pk):
+            name = attr.name
+            query = query.filter(lambda e: getattr(e, name) == value)
+
+        entity = query.get()
+
+        if entity is None:
+            raise ObjectNotFound(self.entity_class, pk)
+
+        return entity
+
+    def get_cached(self, *pk):
+        """
+        Returns the :py:class:`EntitySnapshot` of the entity from the cache,
+        the entity is loaded from the database only if it is not in the cache.
+        """
+        cache = get_cache()
+        key = instance_cache_key(self.entity_class, pk, 'snapshot')
+        snapshot = cache.get(key)
+
+        if snapshot is None:
+            snapshot = EntitySnapshot.dump(self.entity_class.__getitem__(pk))
+            cache.set(key, snapshot, self.cache_timeout)
+
+        class_name, values = snapshot
+        return EntitySnapshot(self.entity_class._database_.entities[class_name], values)
+
+    def get_version(self, version_attr, *pk):
+        """
+        Returns the value of the version attribute of the entity without loading the entity.
+        Raises the ObjectNotFound exception if there is no such object.
+
+        Arguments:
+            version_attr (:obj:`str`): The name of the attribute, for example a version number or an update time.
+            pk: The primary key.
+        """
+        pk_attrs = self.entity_class._pk_attrs_
+        query = self.get_fields_query([attr.name for attr in pk_attrs] + [version_attr])
+
+        for i, (attr, value) in enumerate(zip(pk_attrs, pk)):
+            query = query.filter('e.{} == pk{}'.format(attr.name, i), {}, {'pk{}'.format(i): value})
+
+        rows = query[:1]
+
+        if not rows:
+            raise ObjectNotFound(self.entity_class, pk)
+
+        return rows[0][-1]
+
+    def get_list_version(self, version_attr):
+        """
+        Returns the version of all entities computed by the database without loading them:
+        a tuple of the number of entities and the maximum value of the version attribute.
+        For numeric versions, the sum is added, because updating an entity does not always change the maximum.
+
+        Arguments:
+            version_attr (:obj:`str`): The name of the attribute, for example a version number or an update time.
+        """
+        entity_class = self.get_entity_class()
+        py_type = entity_class._adict_[version_attr].py_type
+        aggregates = ['count(e)', 'max(e.{})'.format(version_attr)]
+
+        if isinstance(py_type, type) and issubclass(py_type, Number):
+            aggregates.append('sum(e.{})'.format(version_attr))
+
+        query = select('({}) for e in entity_class'.format(', '.join(aggregates)),
+                       {'entity_class': entity_class, 'count': count}, {})
+        return tuple(query.get())
+
+    def get_all(self, prefetch=None, fields=None):
+        """
+        Returns all entities.
+
+        Arguments:
+            prefetch (:obj:`tuple`): Relations loaded in bulk together with the entities.
+            fields (:obj:`tuple`): If set, only these attributes are selected
+                and namedtuples are returned instead of entities, see :py:meth:`get_fields_query`.
+        """
+        if fields:
+            return self.make_rows(fields, self.get_fields_query(fields)[:])
+        return self.get_query(prefetch)[:]
 
     def get_one(self, **kwargs):
         return self.entity_class.get(**kwargs)
 
+    def get_page(self, page=1, per_page=20, order_by=None, keyset=False, after=None, with_total=True,
+                 prefetch=None, fields=None):
+        """
+        Returns one page of entities.
+
+        Arguments:
+            page (:obj:`int`): The page number starting from 1, is ignored for the keyset pagination.
+            per_page (:obj:`int`): The maximum number of entities on the page.
+            order_by (:obj:`str` or :obj:`tuple`): Attribute names, see :py:meth:`get_ordering`.
+            keyset (:obj:`bool`): Use the keyset (seek) pagination instead of OFFSET/LIMIT.
+                It requires ordering by one unique attribute.
+            after: The value of the ordering attribute of the last entity on the previous page
+                (:py:attr:`Page.next_cursor`), is used only with the keyset pagination.
+            with_total (:obj:`bool`): Count the total number of entities using the :py:meth:`count` method.
+            prefetch (:obj:`tuple`): Relations loaded in bulk with the page, see :py:meth:`get_prefetch_attrs`.
+            fields (:obj:`tuple`): If set, the page contains namedtuples with only these attributes
+                instead of entities, see :py:meth:`get_fields_query`.
+
+        Returns:
+            :py:class:`Page`: The page of entities.
+        """
+        entity_class = self.get_entity_class()
+        ordering = self.get_ordering(order_by)
+
+        if fields:
+            query = self.get_fields_query(fields, order_by)
+        else:
+            query = self.get_query(prefetch).order_by(*[desc(attr) if d else attr for attr, d in ordering])
+
+        if keyset:
+            if len(ordering) != 1 or not (ordering[0][0].is_pk or ordering[0][0].is_unique):
+                raise ValueError('The keyset pagination requires ordering by one unique attribute.')
+
+            attr, descending = ordering[0]
+            name = attr.name
+
+            if fields and name not in fields:
+                raise ValueError('The keyset pagination requires the ordering attribute in the fields.')
+
+            if after is not None:
+                after = attr.validate(after, entity=entity_class)
+
+                if fields:
+                    query = query.filter('e.{} {} after'.format(name, '<' if descending else '>'),
+                                         {}, {'after': after})
+                elif descending:
+                    query = query.filter(lambda e: getattr(e, name) < after)
+                else:
+                    query = query.filter(lambda e: getattr(e, name) > after)
+
+            page = None
+            items = query[:per_page + 1]
+        else:
+            page = max(page, 1)
+            offset = (page - 1) * per_page
+            items = query[offset:offset + per_page + 1]
+
+        has_next = len(items) > per_page
+        items = items[:per_page]
+
+        if fields:
+            items = self.make_rows(fields, items)
+
+        next_cursor = getattr(items[-1], ordering[0][0].name) if keyset and items else None
+        total = self.count() if with_total else None
+
+        return Page(items, page, per_page, total, has_next, next_cursor)
+
+    def search(self, attr_name, prefix, limit=20):
+        """
+        Returns entities whose attribute value starts with the prefix, sorted by this attribute.
+
+        Arguments:
+            attr_name (:obj:`str`): The name of the string attribute.
+            prefix (:obj:`str`): The beginning of the value.
+            limit (:obj:`int`): The maximum number of entities.
+        """
+        entity_class = self.get_entity_class()
+        attr = entity_class._adict_[attr_name]
+        query = entity_class.select(lambda e: getattr(e, attr_name).startswith(prefix))
+        return query.order_by(attr)[:limit]
+
+    def iter_chunks(self, chunk_size=1000, order_by=None):
+        """
+        Iterates over all entities in chunks using the keyset pagination.
+
+        Each chunk is selected in its own strict db_session,
+        so the session cache is cleared between chunks and memory usage stays flat.
+        The entities of a chunk can only be used until the next chunk is requested.
+        If called inside another db_session, the nested sessions are ignored and the cache is not cleared.
+
+        Arguments:
+            chunk_size (:obj:`int`): The number of entities in one chunk.
+            order_by (:obj:`str`): One unique attribute name, the primary key is used by default.
+
+        Yields:
+            list: Entities of the chunk.
+        """
+        after = None
+
+        while True:
+            with db_session(strict=True):
+                page = self.get_page(per_page=chunk_size, order_by=order_by,
+                                     keyset=True, after=after, with_total=False)
+                if page.items:
+                    yield page.items
+
+            if not page.has_next:
+                break
+
+            after = page.next_cursor
+
     def update(self, entity, **attributes):
+        """
+        Updates the entity in place.
+        Only the attributes whose values have changed are written to the database.
+        For collections only the difference is applied: missing entities are added, extra ones are removed.
+        """
         assert isinstance(entity, self.entity_class)
 
-        entity = pickle.loads(pickle.dumps(entity))
+        adict = self.entity_class._adict_
+        changed = {}
+        modified = False
 
         for attr, value in attributes.items():
-            setattr(entity, attr, value)
+            if adict[attr].is_collection:
+                modified = self._update_collection(getattr(entity, attr), value) or modified
+            elif getattr(entity, attr) != value:
+                changed[attr] = value
+
+        if changed:
+            entity.set(**changed)
+
+        if changed or modified:
+            flush()
+            record_change(entity.__class__, entity._get_raw_pkval_())
+
+    def _update_collection(self, collection, entities):
+        """Applies the difference between the collection and the new entities, returns True if it was changed."""
+        current = set(collection)
+        new = set(entities or ())
+
+        to_add = new - current
+        to_remove = current - new
+
+        if to_add:
+            collection.add(to_add)
+
+        if to_remove:
+            collection.remove(to_remove)
+
+        return bool(to_add or to_remove)
+
+    def update_many(self, entities, **attributes):
+        """
+        Sets the same attribute values for all passed entities
+        and writes the changes to the database with a single flush.
+        """
+        entities = list(entities)
+
+        for entity in entities:
+            assert isinstance(entity, self.entity_class)
+            entity.set(**attributes)
 
         flush()
 
+        for entity in entities:
+            record_change(entity.__class__, entity._get_raw_pkval_())
+
+    def can_bulk_delete(self):
+        """
+        Returns True if the entities can be deleted with the DELETE statement without loading them.
+
+        It is not possible if the entity class or its subclasses have collections,
+        because Pony must delete or update the related rows.
+        """
+        entity_class = self.get_entity_class()
+
+        for cls in (entity_class,) + tuple(entity_class._subclasses_):
+            if any(attr.is_collection for attr in cls._attrs_):
+                return False
+
+        return True
+
+    def delete_many(self, condition):
+        """
+        Deletes all entities matching the condition.
+
+        If possible (see :py:meth:`can_bulk_delete` and :py:meth:`has_loaded_instances`)
+        a single DELETE statement is executed, otherwise the entities are loaded and deleted one by one,
+        so that Pony processes the relations. The entity hooks are not called in the first case.
+
+        Arguments:
+            condition (dict): Entity attributes values that the rows must match.
+
+        Returns:
+            int: The number of deleted entities.
+        """
+        if self.can_bulk_delete():
+            rowcount = self._delete_where(condition)
+        else:
+            rowcount = self._delete_entities(condition)
+
+        record_change(self.get_entity_class())
+        return rowcount
+
+    def has_loaded_instances(self):
+        """
+        Returns True if instances of the entity class are loaded in the current db_session.
+
+        The DELETE and UPDATE statements executed without loading the entities do not change such instances,
+        so the bulk methods process the entities one by one in this case.
+        """
+        entity_class = self.get_entity_class()
+        cache = entity_class._database_._get_cache()
+        return any(isinstance(obj, entity_class) for obj in cache.objects)
+
+    def can_delete_by_pk(self):
+        """
+        Returns True if the :py:meth:`delete_by_pk` method can be used.
+
+        It requires that the entities can be deleted without loading (see :py:meth:`can_bulk_delete`),
+        no one-to-one relation stores the foreign key in the related table
+        and the entity classes do not define the ``before_delete`` and ``after_delete`` hooks.
+        """
+        if not self.can_bulk_delete():
+            return False
+
+        entity_class = self.get_entity_class()
+
+        for cls in (entity_class,) + tuple(entity_class._subclasses_):
+            if any(attr.reverse and not attr.columns for attr in cls._attrs_):
+                return False
+
+            for klass in cls.__mro__:
+                if klass is entity_class._database_.Entity:
+                    break
+                if 'before_delete' in klass.__dict__ or 'after_delete' in klass.__dict__:
+                    return False
+
+        return True
+
+    def delete_by_pk(self, *pk):
+        """
+        Deletes the entity by its primary key with a single DELETE statement, the entity is not loaded.
+
+        Use only if the :py:meth:`can_delete_by_pk` method returns True.
+
+        Returns:
+            bool: False if there is no such entity.
+        """
+        entity_class = self.get_entity_class()
+        condition = dict(zip([attr.name for attr in entity_class._pk_attrs_], pk))
+
+        if not self._delete_where(condition):
+            return False
+
+        record_change(entity_class, pk)
+        return True
+
+    def _delete_entities(self, condition):
+        """Loads the entities matching the condition, deletes them one by one and returns their number."""
+        entities = self.get_entity_class().select(**condition)[:]
+
+        for entity in entities:
+            entity.delete()
+
+        flush()
+        return len(entities)
+
+    def _delete_where(self, condition):
+        """
+        Executes the DELETE statement and returns the number of deleted rows.
+
+        If instances of the entity class are loaded in the current db_session,
+        the entities are deleted one by one, so that the session does not keep the deleted instances.
+        """
+        if self.has_loaded_instances():
+            return self._delete_entities(condition)
+
+        entity_class = self.get_entity_class()
+        db = entity_class._database_
+        params = {}
+        where = get_sql_condition(entity_class, condition, params)
+
+        flush()
+        use_primary(db)
+
+        sql = 'DELETE FROM {} WHERE {}'.format(db.provider.quote_name(entity_class._table_), where)
+        return self._execute(sql, params).rowcount
+
+    def bulk_update(self, condition, **attributes):
+        """
+        Updates all entities matching the condition with a single UPDATE statement,
+        the entities are not loaded from the database.
+
+        If instances of the entity class are loaded in the current db_session (see :py:meth:`has_loaded_instances`),
+        the matching entities are loaded and updated with :py:meth:`update_many` instead,
+        so that the session does not keep outdated values.
+
+        Arguments:
+            condition (dict): Entity attributes values that the rows must match.
+            attributes (dict): Entity attributes with new values.
+
+        Returns:
+            int: The number of updated rows.
+        """
+        entity_class = self.get_entity_class()
+
+        if self.has_loaded_instances():
+            entities = entity_class.select(**condition)[:]
+            self.update_many(entities, **attributes)
+            return len(entities)
+
+        db = entity_class._database_
+        params = {}
+
+        assignments = ', '.join(
+            '{} = {}'.format(column, placeholder or 'NULL')
+            for column, placeholder in get_sql_params(entity_class, attributes, params)
+        )
+        where = get_sql_condition(entity_class, condition, params)
+
+        flush()
+        use_primary(db)
+
+        sql = 'UPDATE {} SET {} WHERE {}'.format(db.provider.quote_name(entity_class._table_), assignments, where)
+        rowcount = self._execute(sql, params).rowcount
+        record_change(entity_class)
+        return rowcount
+
 
-__all__ = ('Repository', 'PonyRepository')
+__all__ = ('Repository', 'PonyRepository', 'Page', 'EntitySnapshot')
@@ -0,0 +1,252 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from functools import wraps
+import logging
+from threading import Lock
+from time import time
+
+from flask import current_app, g, has_app_context, request
+from pony.orm import core
+from pony_database_facade import DatabaseFacade
+
+
+__all__ = ('RoutingPool', 'create_replica_pool', 'use_primary', 'route_writes')
+
+
+logger = logging.getLogger('flask_pony.routing')
+
+#: The cookie that pins the client to the primary database after writes.
+PIN_COOKIE = 'pony_primary'
+
+
+class RoutingPool(object):
+    """
+    The connection pool of the Pony provider that gives connections to replicas
+    for read-only db_sessions and to the primary database for others.
+
+    The pool remembers which pool gave each connection to return it there.
+
+    Arguments:
+        primary: The pool of the primary database.
+        replicas (list): Pools of the replicas.
+        strategy (:obj:`str`): ``round_robin`` or ``least_loaded`` (the smallest number of connections in use).
+    """
+
+    def __init__(self, primary, replicas, strategy='round_robin'):
+        if strategy not in ('round_robin', 'least_loaded'):
+            raise ValueError('Unknown replica strategy "{}"'.format(strategy))
+
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+
+        self.__lock = Lock()
+        self.__counter = 0
+        self.__in_use = [0] * len(self.replicas)
+        self.__owners = {}
+
+    @property
+    def in_use(self):
+        """The number of connections in use for each replica."""
+        return list(self.__in_use)
+
+    def is_replica(self, con):
+        """Returns True if the connection belongs to a replica."""
+        return self.__owners.get(id(con)) is not None
+
+    def choose_replica(self):
+        """Returns the index of the replica for a new connection."""
+        with self.__lock:
+            if self.strategy == 'least_loaded':
+                return min(range(len(self.replicas)), key=lambda i: self.__in_use[i])
+
+            self.__counter += 1
+            return self.__counter % len(self.replicas)
+
+    def connect(self):
+        index = None
+
+        if self.replicas and wants_replica():
+            index = self.choose_replica()
+
+            try:
+                result = self.replicas[index].connect()
+            except Exception:
+                logger.warning('Replica %d is unavailable, the primary database is used', index, exc_info=True)
+                index = None
+            else:
+                with self.__lock:
+                    self.__in_use[index] += 1
+
+        if index is None:
+            result = self.primary.connect()
+
+        self.__owners[id(result[0])] = index
+        return result
+
+    def __finish(self, method, con):
+        index = self.__owners.pop(id(con), None)
+
+        if index is None:
+            return getattr(self.primary, method)(con)
+
+        with self.__lock:
+            self.__in_use[index] -= 1
+
+        return getattr(self.replicas[index], method)(con)
+
+    def release(self, con):
+        return self.__finish('release', con)
+
+    def drop(self, con):
+        return self.__finish('drop', con)
+
+    def disconnect(self):
+        self.primary.disconnect()
+
+        for pool in self.replicas:
+            pool.disconnect()
+
+
+def create_replica_pool(config, replica):
+    """
+    Returns the connection pool of the replica.
+
+    Arguments:
+        config (dict): The settings of the primary database (``PONY``).
+        replica (dict): The settings that differ for the replica, for example ``{'host': 'replica1'}``.
+    """
+    options = dict(config)
+    options.update(replica)
+    facade = DatabaseFacade(**options)
+    facade.bind()
+    return facade.original.provider.pool
+
+
+def is_pinned():
+    """Returns True if the client wrote to the database less than PONY_REPLICA_LAG seconds ago."""
+    try:
+        return float(request.cookies.get(PIN_COOKIE, 0)) > time()
+    except ValueError:
+        return False
+
+
+def select_route(readonly, replica=None):
+    """
+    Decides whether the db_session of the current request can read from a replica.
+
+    Arguments:
+        readonly (:obj:`bool`): The session is read-only.
+        replica (:obj:`bool`): The ``replica`` option of the session policy,
+            allows (True) or forbids (False) replicas regardless of the HTTP method.
+    """
+    config = current_app.config
+
+    if replica is None:
+        replica = readonly or request.method in config['PONY_REPLICA_METHODS']
+
+    g._pony_use_replica = bool(config['PONY_REPLICAS'] and replica and not is_pinned())
+
+
+def wants_replica():
+    return has_app_context() and g.get('_pony_use_replica', False)
+
+
+def use_primary(db):
+    """
+    Switches the db_session of the current request to the primary database before writing.
+
+    The transaction on the replica contains only reads, so it is rolled back,
+    and the following queries of the db_session use a connection to the primary database.
+    """
+    if has_app_context():
+        g._pony_use_replica = False
+        g._pony_wrote = True
+
+    pool = getattr(db.provider, 'pool', None)
+    cache = core.local.db2cache.get(db)
+
+    if cache is None or cache.connection is None:
+        return
+
+    if not isinstance(pool, RoutingPool) or not pool.is_replica(cache.connection):
+        return
+
+    con, cache.connection = cache.connection, None
+    db.provider.rollback(con, cache)
+    db.provider.release(con, cache)
+    cache.in_transaction = False
+
+
+def route_writes(db):
+    """
+    Makes Pony switch to the primary database before saving entities
+    and before flushing any changes of the db_session, including changes of collections.
+    """
+    before_save = db.Entity._before_save_
+
+    if getattr(before_save, '__pony_routed__', False):
+        return
+
+    def _before_save_(obj):
+        use_primary(db)
+        before_save(obj)
+
+    _before_save_.__pony_routed__ = True
+    db.Entity._before_save_ = _before_save_
+    db._get_cache = route_flush(db, db._get_cache)
+
+
+def route_flush(db, get_cache):
+    """
+    Wraps the :py:meth:`Database._get_cache` method,
+    so that the session cache switches to the primary database before flushing the changes.
+    The flush is also called by Pony before the commit.
+    """
+    @wraps(get_cache)
+    def wrapper(*args, **kwargs):
+        cache = get_cache(*args, **kwargs)
+
+        if not getattr(cache, '_pony_routed', False):
+            flush = cache.flush
+
+            def routed_flush():
+                if cache.modified:
+                    use_primary(db)
+                return flush()
+
+            cache.flush = routed_flush
+            cache._pony_routed = True
+
+        return cache
+
+    return wrapper
+
+
+def has_pending_writes():
+    """Returns True if the db_session has changes that are not flushed yet."""
+    return any(cache.modified for cache in core.local.db2cache.values())
+
+
+def pin_to_primary(response):
+    """Sets the cookie that sends the client's reads to the primary database while replicas catch up."""
+    lag = current_app.config['PONY_REPLICA_LAG']
+
+    if lag and (g.get('_pony_wrote', False) or has_pending_writes()):
+        response.set_cookie(PIN_COOKIE, str(time() + lag), max_age=int(lag) or 1, httponly=True)
+
+    return response
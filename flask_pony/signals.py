@@ -0,0 +1,27 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from flask.signals import Namespace
+
+
+__all__ = ('queries_executed',)
+
+
+_signals = Namespace()
+
+#: Sent when the db_session of the request ends, if the instrumentation is enabled.
+#: The sender is the application, the ``stats`` argument is the :py:class:`~flask_pony.instrumentation.QueryStats`.
+queries_executed = _signals.signal('queries-executed')
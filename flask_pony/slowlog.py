@@ -0,0 +1,254 @@
+# coding: utf-8
+#
+# Copyright 2018 Kirill Vercetti
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+import glob
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+from threading import Lock
+from time import time
+
+from .compat import replace_file
+
+
+__all__ = ('SlowQueryLog', 'fingerprint', 'load_snapshots')
+
+
+logger = logging.getLogger('flask_pony.slow_query')
+
+_comments_re = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_strings_re = re.compile(r"'(?:[^']|'')*'")
+_numbers_re = re.compile(r'(?<![\w"$])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_params_re = re.compile(r'\$\w+|%\(\w+\)s|%s|(?<!:):\w+|\?')
+_lists_re = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_spaces_re = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    Returns the statement without literals, parameters and extra spaces,
+    so that the same statements with different values have the same fingerprint.
+
+    Example:
+        >>> fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'a'")
+        "SELECT * FROM t WHERE id IN (?) AND name = ?"
+    """
+    sql = _comments_re.sub(' ', sql)
+    sql = _strings_re.sub('?', sql)
+    sql = _numbers_re.sub('?', sql)
+    sql = _params_re.sub('?', sql)
+    sql = _lists_re.sub('(?)', sql)
+    return _spaces_re.sub(' ', sql).strip()
+
+
+def percentile(values, p):
+    """Returns the p-th percentile (0-100) of the sorted values."""
+    if not values:
+        return None
+    index = int(round(p / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class FingerprintStats(object):
+    __slots__ = ('count', 'slow', 'total', 'samples')
+
+    def __init__(self, max_samples):
+        self.count = 0
+        self.slow = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def record(self, duration, slow):
+        self.count += 1
+        self.total += duration
+        self.samples.append(duration)
+        if slow:
+            self.slow += 1
+
+
+class SlowQueryLog(object):
+    """
+    Logs slow statements and aggregates the execution time by statement fingerprints.
+
+    Arguments:
+        threshold (:obj:`float`): Statements running longer than threshold milliseconds are logged.
+        sample_rate (:obj:`float`): The fraction (0-1) of statements included in the aggregated statistics,
+            slow statements are always logged.
+        max_samples (:obj:`int`): The number of the latest durations kept for percentiles of each fingerprint.
+        dump_dir (:obj:`str`): The directory where the process periodically saves its statistics,
+            so that they can be read by the ``flask pony slow-queries`` command.
+        dump_interval (:obj:`int`): The minimum interval in seconds between dumps.
+        max_age (:obj:`int`): Dumps older than max_age seconds (of exited processes) are removed,
+            10 intervals but at least 10 minutes by default.
+    """
+
+    def __init__(self, threshold, sample_rate=1.0, max_samples=1000, dump_dir=None, dump_interval=60,
+                 max_age=None):
+        self.threshold = threshold / 1000.0
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self.dump_dir = dump_dir
+        self.dump_interval = dump_interval
+        self.max_age = max_age or max(dump_interval * 10, 600)
+
+        self.__lock = Lock()
+        self.__dump_lock = Lock()
+        self.__stats = {}
+        self.__last_dump = time()
+
+    def __call__(self, sql, duration):
+        slow = duration >= self.threshold
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+
+        if not slow and not sampled:
+            return
+
+        if slow:
+            logger.warning('Slow query (%.2f ms): %s', duration * 1000, sql)
+
+        if sampled:
+            key = fingerprint(sql)
+
+            with self.__lock:
+                stats = self.__stats.get(key)
+                if stats is None:
+                    stats = self.__stats[key] = FingerprintStats(self.max_samples)
+                stats.record(duration, slow)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: The fingerprint -> ``{'count', 'slow', 'total', 'samples'}``.
+        """
+        with self.__lock:
+            return {
+                key: {
+                    'count': s.count,
+                    'slow': s.slow,
+                    'total': s.total,
+                    'samples': list(s.samples),
+                }
+                for key, s in self.__stats.items()
+            }
+
+    def top(self, limit=20):
+        """Returns the statistics of fingerprints with the largest total time, see :py:func:`summarize`."""
+        return summarize(self.snapshot(), limit)
+
+    def maybe_dump(self):
+        """
+        Saves the statistics if the dump interval has passed since the last dump.
+
+        It is called after each request, errors are logged and never propagate to the request.
+        Returns True if the statistics were saved.
+        """
+        if not self.dump_dir or time() - self.__last_dump < self.dump_interval:
+            return False
+
+        if not self.__dump_lock.acquire(False):
+            return False
+
+        try:
+            if time() - self.__last_dump < self.dump_interval:
+                return False
+
+            self.__last_dump = time()
+            self.dump()
+            self.cleanup()
+            return True
+        except Exception:
+            logger.exception('Unable to save the slow query statistics to %s', self.dump_dir)
+            return False
+        finally:
+            self.__dump_lock.release()
+
+    def dump(self):
+        """Saves the statistics of the current process to the dump directory."""
+        pid = os.getpid()
+        fd, tmp = tempfile.mkstemp(prefix='slow_queries.{}.'.format(pid), suffix='.tmp', dir=self.dump_dir)
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            replace_file(tmp, os.path.join(self.dump_dir, 'slow_queries.{}.json'.format(pid)))
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def cleanup(self):
+        """Removes the dumps and temporary files that were not updated for ``max_age`` seconds."""
+        expired = time() - self.max_age
+        own = 'slow_queries.{}.'.format(os.getpid())
+
+        for filename in glob.glob(os.path.join(self.dump_dir, 'slow_queries.*')):
+            if os.path.basename(filename).startswith(own):
+                continue
+
+            try:
+                if os.path.getmtime(filename) < expired:
+                    os.remove(filename)
+            except OSError:
+                pass
+
+    def reset(self):
+        with self.__lock:
+            self.__stats.clear()
+
+
+def load_snapshots(dump_dir):
+    """Reads and merges the statistics saved by all processes into the dump directory."""
+    merged = {}
+
+    for filename in glob.glob(os.path.join(dump_dir, 'slow_queries.*.json')):
+        with open(filename) as f:
+            snapshot = json.load(f)
+
+        for key, data in snapshot.items():
+            item = merged.setdefault(key, {'count': 0, 'slow': 0, 'total': 0.0, 'samples': []})
+            item['count'] += data['count']
+            item['slow'] += data['slow']
+            item['total'] += data['total']
+            item['samples'].extend(data['samples'])
+
+    return merged
+
+
+def summarize(snapshot, limit=20):
+    """
+    Returns:
+        list: Dicts with the fingerprint, count, slow count, total time and p50/p95/p99 in milliseconds,
+        sorted by the total time in descending order.
+    """
+    result = []
+
+    for key, data in snapshot.items():
+        samples = sorted(data['samples'])
+        result.append({
+            'fingerprint': key,
+            'count': data['count'],
+            'slow': data['slow'],
+            'total': data['total'] * 1000,
+            'p50': (percentile(samples, 50) or 0) * 1000,
+            'p95': (percentile(samples, 95) or 0) * 1000,
+            'p99': (percentile(samples, 99) or 0) * 1000,
+        })
+
+    result.sort(key=lambda item: item['total'], reverse=True)
+    return result[:limit]
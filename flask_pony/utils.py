@@ -54,3 +54,76 @@ def camel_to_snake(name):
 
 def snake_to_camel(name):
     return ''.join(name.title().split('_'))
+
+
+def get_db_values(attr, value):
+    """Returns the values of the database columns for the value of the entity attribute."""
+    if attr.reverse:
+        if value is None:
+            return (None,) * len(attr.columns)
+        if isinstance(value, attr.py_type):
+            return value._get_raw_pkval_()
+        return value if isinstance(value, tuple) else (value,)
+
+    value = attr.validate(value, entity=attr.entity)
+
+    if value is not None and attr.converters:
+        value = attr.converters[0].val2dbval(value)
+
+    return (value,)
+
+
+def get_sql_params(entity_class, attributes, params):
+    """
+    Converts the values of the entity attributes to the SQL parameters.
+
+    Returns a list of pairs (quoted column name, parameter placeholder),
+    the placeholder is None for NULL values.
+    The parameter values are stored in the params dictionary.
+    """
+    quote_name = entity_class._database_.provider.quote_name
+    result = []
+
+    for name, value in attributes.items():
+        attr = entity_class._adict_[name]
+
+        for column, dbval in zip(attr.columns, get_db_values(attr, value)):
+            if dbval is None:
+                result.append((quote_name(column), None))
+            else:
+                key = 'p{}'.format(len(params))
+                params[key] = dbval
+                result.append((quote_name(column), '${}'.format(key)))
+
+    return result
+
+
+def get_sql_condition(entity_class, condition, params, discriminate=True):
+    """
+    Returns the SQL condition that compares the entity attributes with the values using AND.
+
+    If discriminate is True and the entity class is inherited,
+    the condition also filters the rows of this class and its subclasses.
+    """
+    clauses = []
+
+    for column, placeholder in get_sql_params(entity_class, condition, params):
+        if placeholder is None:
+            clauses.append('{} IS NULL'.format(column))
+        else:
+            clauses.append('{} = {}'.format(column, placeholder))
+
+    discriminator = entity_class._discriminator_attr_
+
+    if discriminate and discriminator and entity_class._root_ is not entity_class:
+        quote_name = entity_class._database_.provider.quote_name
+        placeholders = []
+
+        for cls in (entity_class,) + tuple(entity_class._subclasses_):
+            key = 'p{}'.format(len(params))
+            params[key] = cls._discriminator_
+            placeholders.append('${}'.format(key))
+
+        clauses.append('{} IN ({})'.format(quote_name(discriminator.column), ', '.join(placeholders)))
+
+    return ' AND '.join(clauses) or '1 = 1'
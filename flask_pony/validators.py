@@ -17,8 +17,10 @@
 from pony.orm.ormtypes import UUID
 from wtforms.validators import StopValidation
 
+from .utils import get_sql_condition
 
-__all__ = ('UniqueEntityValidator',)
+
+__all__ = ('UniqueEntityValidator', 'UniqueKeysValidator')
 
 
 class Validator(object):
@@ -56,6 +58,85 @@ class UniqueEntityValidator(EntityValidator):
             raise StopValidation(msg)
 
 
+class UniqueKeysValidator(EntityValidator):
+    """
+    Form-level validator that checks all unique keys of the entity (including composite ones)
+    with a single query and adds errors to the fields of the conflicting keys.
+
+    Arguments:
+        entity_class: The entity class.
+        keys (:obj:`list`): Tuples of attribute names, one tuple for each unique key.
+    """
+
+    def __init__(self, entity_class, keys, message=None):
+        super(UniqueKeysValidator, self).__init__(entity_class, message)
+        self.keys = [tuple(key) for key in keys]
+
+    def get_conditions(self, form):
+        """Returns pairs (key, values) for keys that must be checked."""
+        original_entity = form.original_entity
+        conditions = []
+
+        for key in self.keys:
+            fields = [form[name] for name in key]
+
+            if any(field.errors for field in fields):
+                continue
+
+            values = {field.name: field.data for field in fields}
+
+            if any(value is None for value in values.values()):
+                continue
+
+            if original_entity and all(getattr(original_entity, n) == v for n, v in values.items()):
+                continue
+
+            conditions.append((key, values))
+
+        return conditions
+
+    def __call__(self, form):
+        """
+        Returns:
+            bool: False if any key is already used.
+        """
+        conditions = self.get_conditions(form)
+
+        if not conditions:
+            return True
+
+        entity_class = self.entity_class
+        params = {}
+        where = ' OR '.join(
+            '({})'.format(get_sql_condition(entity_class, values, params, discriminate=False))
+            for key, values in conditions
+        )
+        table = entity_class._database_.provider.quote_name(entity_class._table_)
+        sql = 'SELECT * FROM {} WHERE {}'.format(table, where)
+
+        original_entity = form.original_entity
+        valid = True
+
+        for entity in entity_class._root_.select_by_sql(sql, params):
+            if entity == original_entity:
+                continue
+
+            for key, values in conditions:
+                if all(getattr(entity, n) == v for n, v in values.items()):
+                    field = form[key[0]]
+                    msg = self.message or (
+                        'This value is already used.' if len(key) == 1 else
+                        'This combination of values is already used.'
+                    )
+
+                    if msg not in field.errors:
+                        field.errors.append(msg)
+
+                    valid = False
+
+        return valid
+
+
 class UUIDValidator(Validator):
     def __call__(self, form, field):
         try:
@@ -14,10 +14,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from flask import render_template, request, abort, redirect, url_for
+import calendar
+import csv
+from datetime import datetime
+import hashlib
+import json
+
+from flask import (Response, abort, current_app, jsonify, make_response, redirect, render_template, request,
+                   url_for)
 from flask.views import MethodView
 from pony.orm import ObjectNotFound
+from pony.orm.core import Entity
+from six import StringIO, text_type
 
+from .cache import entity_cache_key, get_cache, instance_cache_key
+from .compat import is_session_accessed
+from .forms import EntityField
 from .orm import FormBuilder
 from .utils import get_route_param_names, camelcase2list
 
@@ -75,9 +87,16 @@ class EntityMixin(object):
 
     Attributes:
         repository_class (:py:class:`~flask_pony.repositories.PonyRepository`): A reference to the class of the repository.
+        prefetch (:obj:`tuple`): Relations loaded in bulk together with the entities,
+            for example ``('author', 'tags')``, so that templates do not load them one by one.
     """
 
     repository_class = None
+    prefetch = None
+
+    def get_prefetch(self):
+        """Returns the names of relations loaded together with the entities."""
+        return self.prefetch
 
     def get_repository_class(self):
         """
@@ -95,10 +114,11 @@ class EntityMixin(object):
         """
         return self.get_repository_class()(*args, **kwargs)
 
-    def get_entity_or_abort(self, *pk):
+    def get_entity_or_abort(self, *pk, **kwargs):
         """
         Arguments:
             pk: primary key.
+            cached (:obj:`bool`): Allow the entity from the repository cache, True by default.
 
         Returns:
             :py:attr:`~Database.Entity`: An entity instance selected by its primary key.
@@ -106,8 +126,17 @@ class EntityMixin(object):
         Raises:
             :py:exc:`HTTPException`: If there is no such object.
         """
+        options = {}
+        prefetch = self.get_prefetch()
+
+        if prefetch:
+            options['prefetch'] = prefetch
+
+        if not kwargs.get('cached', True):
+            options['cached'] = False
+
         try:
-            return self.get_repository().get(*pk)
+            return self.get_repository().get(*pk, **options)
         except ObjectNotFound:
             abort(404)
 
@@ -120,9 +149,12 @@ class BaseView(MethodView):
 
     Attributes:
         template_name (:obj:`str`): The name of the template.
+        session_policy (:obj:`dict`): The db_session options for each HTTP method,
+            for example ``{'GET': {'readonly': True, 'strict': True}}``.
     """
 
     template_name = None
+    session_policy = None
 
     def __init__(self, template_name=None):
         if template_name:
@@ -152,18 +184,151 @@ class BaseView(MethodView):
         return render_template(self.get_template_name(), **context)
 
 
-class EntityView(BaseView, EntityMixin):
+class ConditionalMixin(object):
+    """
+    Mixin to answer conditional GET requests (``If-None-Match``, ``If-Modified-Since``) with 304 Not Modified.
+
+    Attributes:
+        version_attr (:obj:`str`): The entity attribute that changes with each update,
+            for example a version number or an update time. Conditional requests are disabled if not set.
+            If the attribute is a datetime, it is also sent as the ``Last-Modified`` header,
+            see :py:meth:`get_last_modified`.
+    """
+
+    version_attr = None
+
+    def get_etag(self, *parts):
+        """
+        Returns the ETag computed from the values identifying the state of the response.
+
+        Override to add values that also change the rendered page, for example the current user.
+        """
+        return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+    def get_last_modified(self, version):
+        """
+        Returns the value of the version attribute as an aware datetime for the ``Last-Modified`` header,
+        or None if it is not a datetime.
+
+        Naive datetimes are in the timezone of the ``PONY_TIMEZONE`` option (a ``tzinfo`` object),
+        if it is not set, they are used only for the ETag, because their timezone is unknown.
+        """
+        if not isinstance(version, datetime):
+            return None
+
+        if version.tzinfo is None:
+            timezone = current_app.config.get('PONY_TIMEZONE')
+
+            if timezone is None:
+                return None
+
+            localize = getattr(timezone, 'localize', None)  # pytz timezones
+            version = localize(version) if localize else version.replace(tzinfo=timezone)
+
+        return version
+
+    def is_not_modified(self, etag, last_modified=None):
+        """Checks the conditional headers of the request."""
+        if request.if_none_match:
+            return request.if_none_match.contains(etag)
+
+        if last_modified is not None and request.if_modified_since is not None:
+            timestamp = calendar.timegm(last_modified.utctimetuple())
+            return timestamp <= calendar.timegm(request.if_modified_since.utctimetuple())
+
+        return False
+
+    def make_conditional(self, etag, last_modified, render):
+        """
+        Returns the empty 304 response if the client has the actual version,
+        otherwise renders the response by calling the render function.
+        """
+        if self.is_not_modified(etag, last_modified):
+            response = Response(status=304)
+        else:
+            response = make_response(render())
+
+        response.set_etag(etag)
+
+        if last_modified is not None:
+            response.last_modified = last_modified
+
+        return response
+
+
+class CacheMixin(object):
+    """
+    Mixin to cache the rendered pages.
+
+    The cache keys depend on versions of the entity class,
+    so the pages are invalidated when the entities are changed.
+    Changes of related entities displayed on the page do not invalidate it.
+
+    The same page is shown to all users, so by default it is saved only if the rendering
+    did not access the session (for example, to get the current user or flashed messages).
+    Pages that depend on the user are cached if :py:meth:`get_cache_vary` returns the values they depend on.
+
+    Attributes:
+        cache_timeout (:obj:`int`): Time in seconds to keep the rendered page in the cache,
+            caching is disabled if not set.
+    """
+
+    cache_timeout = None
+
+    def get_cache_vary(self):
+        """
+        Returns a tuple of values the page depends on besides the URL and the entities,
+        for example the id of the current user or their role. The values are added to the cache key.
+
+        Returns None by default: the page is cached only if it does not use the session.
+        """
+        return None
+
+    def cached(self, key, render):
+        """Returns the page from the cache or renders it by calling the render function and saves it."""
+        if self.cache_timeout is None:
+            return render()
+
+        vary = self.get_cache_vary()
+
+        if vary is not None:
+            key = ':'.join([key, 'vary'] + [str(value) for value in vary])
+
+        cache = get_cache()
+        content = cache.get(key)
+
+        if content is None:
+            content = render()
+
+            if vary is not None or not is_session_accessed():
+                cache.set(key, content, self.cache_timeout)
+
+        return content
+
+
+class EntityView(BaseView, EntityMixin, ConditionalMixin, CacheMixin):
     """Base view for working with entities."""
 
 
 class ProcessFormView(EntityView, FormMixin):
-    """Render a form on GET and processes it on POST."""
+    """
+    Render a form on GET and processes it on POST.
+
+    Attributes:
+        form_base_class (:py:class:`~flask_pony.forms.Form`):
+            The base class of the form generated by the :py:class:`~flask_pony.orm.FormBuilder`.
+        form_excludes (:obj:`tuple`): Entity attributes that are excluded from the generated form.
+    """
 
     form_class = FormBuilder
+    form_base_class = None
+    form_excludes = None
 
     def get_form_class(self):
         if issubclass(self.form_class, FormBuilder):
-            self.form_class = self.form_class.get_instance(self.get_repository().get_entity_class())
+            return self.form_class.get_form_class(self.get_repository().get_entity_class(),
+                                                  self.form_base_class,
+                                                  self.form_excludes)
         return super(ProcessFormView, self).get_form_class()
 
     # def process_form(self, form):
@@ -178,19 +343,270 @@ class ProcessFormView(EntityView, FormMixin):
 
 
 class ListView(EntityView):
-    """View for listing an entities retrieved using the repository."""
+    """
+    View for listing an entities retrieved using the repository.
+
+    Attributes:
+        paginate_by (:obj:`int`): The number of entities on the page, pagination is disabled by default.
+        pagination (:obj:`str`): The pagination mode: ``offset`` (the ``page`` query parameter)
+            or ``keyset`` (the ``after`` query parameter).
+        ordering (:obj:`str` or :obj:`tuple`): Attribute names used for sorting,
+            see :py:meth:`~flask_pony.repositories.PonyRepository.get_ordering`.
+        list_fields (:obj:`tuple`): If set, only these attributes are selected and the template
+            receives namedtuples instead of entities.
+    """
+
+    paginate_by = None
+    pagination = 'offset'
+    ordering = None
+    list_fields = None
+
+    def get_page(self, fields=None):
+        """
+        Arguments:
+            fields (:obj:`tuple`): Selected attributes, :py:attr:`list_fields` by default.
+
+        Returns:
+            :py:class:`~flask_pony.repositories.Page`: The page of entities selected by the query parameters.
+        """
+        repository = self.get_repository()
+        fields = fields or self.list_fields
+
+        if self.pagination == 'keyset':
+            return repository.get_page(per_page=self.paginate_by, order_by=self.ordering,
+                                       keyset=True, after=self.get_cursor(repository),
+                                       prefetch=self.get_prefetch(), fields=fields)
+
+        page = request.args.get('page', 1, type=int)
+
+        if page < 1:
+            abort(404)
+
+        return repository.get_page(page, self.paginate_by, order_by=self.ordering,
+                                   prefetch=self.get_prefetch(), fields=fields)
+
+    def get_cursor(self, repository):
+        """
+        Returns:
+            The value of the ``after`` query parameter converted to the type of the ordering attribute,
+            None if the parameter is not passed.
+
+        Raises:
+            :py:exc:`HTTPException`: If the value is invalid.
+        """
+        after = request.args.get('after') or None
+
+        if after is None:
+            return None
+
+        attr = repository.get_ordering(self.ordering)[0][0]
+
+        try:
+            return attr.validate(after, entity=attr.entity)
+        except (TypeError, ValueError):
+            abort(404)
+
+    def get_cache_key(self):
+        """
+        Returns the key of the rendered page, it depends on the query parameters
+        and becomes invalid when any entity of the class is changed.
+        """
+        entity_class = self.get_repository().get_entity_class()
+        return entity_cache_key(entity_class, 'view', request.endpoint, request.full_path)
+
+    def render_list(self):
+        return self.cached(self.get_cache_key(), self._render_list)
+
+    def _render_list(self):
+        if not self.paginate_by:
+            entities = self.get_repository().get_all(prefetch=self.get_prefetch(), fields=self.list_fields)
+            return self.render_template(entities=entities)
+
+        page = self.get_page()
+        return self.render_template(entities=page.items, page=page)
 
     def get(self):
-        entities = self.get_repository().get_all()
-        return self.render_template(entities=entities)
+        if self.version_attr is None:
+            return self.render_list()
+
+        repository = self.get_repository()
+
+        if not self.paginate_by:
+            state = repository.get_list_version(self.version_attr)
+            return self.make_conditional(self.get_etag(state), self.get_last_modified(state[1]), self.render_list)
+
+        fields = [attr.name for attr in repository.get_entity_class()._pk_attrs_]
+        fields.extend(attr.name for attr, _ in repository.get_ordering(self.ordering) if attr.name not in fields)
+
+        if self.version_attr not in fields:
+            fields.append(self.version_attr)
+
+        page = self.get_page(fields)
+        versions = [getattr(row, self.version_attr) for row in page.items]
+        versions = [version for version in versions if isinstance(version, datetime)]
+        etag = self.get_etag([tuple(row) for row in page.items], (page.page, page.total, page.has_next))
+
+        return self.make_conditional(etag, self.get_last_modified(max(versions) if versions else None),
+                                     self.render_list)
+
+
+class ExportView(EntityView):
+    """
+    View for streaming all entities as CSV or newline-delimited JSON.
+
+    Entities are fetched in chunks using
+    :py:meth:`~flask_pony.repositories.PonyRepository.iter_chunks`,
+    so memory usage does not depend on the table size.
+
+    Attributes:
+        export_format (:obj:`str`): The default format: ``csv`` or ``ndjson``,
+            can be changed with the ``format`` query parameter.
+        export_fields (:obj:`tuple`): Names of the exported attributes,
+            all non-lazy attributes except collections are exported by default.
+        chunk_size (:obj:`int`): The number of entities selected by one query.
+        ordering (:obj:`str`): One unique attribute used for the keyset ordering, the primary key by default.
+    """
+
+    export_format = 'csv'
+    export_fields = None
+    chunk_size = 1000
+    ordering = None
+
+    mimetypes = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    def get_export_fields(self):
+        """
+        Returns:
+            list: Names of the exported attributes.
+        """
+        if self.export_fields is not None:
+            return list(self.export_fields)
+
+        entity_class = self.get_repository().get_entity_class()
+        return [attr.name for attr in entity_class._attrs_ if not attr.is_collection and not attr.lazy]
+
+    def get_row(self, entity, fields):
+        """
+        Returns:
+            list: Values of the exported attributes, related entities are replaced with primary keys.
+        """
+        row = []
+
+        for name in fields:
+            value = getattr(entity, name)
+
+            if isinstance(value, Entity):
+                value = EntityField.PK_SEPARATOR.join(text_type(v) for v in value._get_raw_pkval_())
+
+            row.append(value)
+
+        return row
+
+    def format_csv(self, rows):
+        buf = StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue()
+
+    def format_ndjson(self, rows, fields):
+        return ''.join(json.dumps(dict(zip(fields, row)), default=text_type) + '\n' for row in rows)
+
+    def generate(self, repository, fmt, fields):
+        """
+        Yields the exported data, one string per chunk of entities.
+
+        The generator runs after the application context is torn down,
+        so the repository is created in advance by the :py:meth:`get` method.
+        """
+        if fmt == 'csv':
+            yield self.format_csv([fields])
+
+        for chunk in repository.iter_chunks(self.chunk_size, self.ordering):
+            rows = [self.get_row(entity, fields) for entity in chunk]
+
+            if fmt == 'csv':
+                yield self.format_csv(rows)
+            else:
+                yield self.format_ndjson(rows, fields)
+
+    def get(self):
+        fmt = request.args.get('format', self.export_format)
+
+        if fmt not in self.mimetypes:
+            abort(404)
+
+        repository = self.get_repository()
+        filename = '{}.{}'.format(repository.get_entity_class().__name__.lower(), fmt)
+
+        return Response(self.generate(repository, fmt, self.get_export_fields()),
+                        mimetype=self.mimetypes[fmt],
+                        headers={'Content-Disposition': 'attachment; filename={}'.format(filename)})
+
+
+class AutocompleteView(EntityMixin, MethodView):
+    """
+    View for searching entities by the beginning of the label,
+    is used by the :py:class:`~flask_pony.forms.EntityField` in the search mode.
+
+    Returns JSON ``{"results": [{"id": "<pk>", "text": "<label>"}, ...]}``
+    for the ``q`` query parameter, primary keys are encoded the same way as in the field.
+
+    Attributes:
+        search_attr (:obj:`str`): The name of the attribute used as the label.
+        limit (:obj:`int`): The maximum number of entities in the response.
+        min_length (:obj:`int`): The minimum length of the query.
+        field_class (:py:class:`~flask_pony.forms.EntityField`): The class of the form field
+            that uses the view, its ``pk2str`` method encodes the primary keys.
+    """
+
+    search_attr = None
+    limit = 20
+    min_length = 1
+    field_class = EntityField
+
+    def get_search_attr(self):
+        if self.search_attr is None:
+            raise AttributeError('You must assign the value of the attribute "search_attr".')
+        return self.search_attr
+
+    def get(self):
+        q = request.args.get('q', '').strip()
+        results = []
+
+        if len(q) >= self.min_length:
+            name = self.get_search_attr()
+            entities = self.get_repository().search(name, q, self.limit)
+            results = [{'id': self.field_class.pk2str(e), 'text': getattr(e, name)} for e in entities]
+
+        return jsonify(results=results)
 
 
 class ShowView(EntityView):
     """View for displaying an entity instance selected by its primary key."""
 
+    def get_cache_key(self, id):
+        """Returns the key of the rendered page, it becomes invalid when the entity is changed."""
+        entity_class = self.get_repository().get_entity_class()
+        return instance_cache_key(entity_class, id, 'view', request.endpoint)
+
+    def render_entity(self, id):
+        return self.cached(self.get_cache_key(id),
+                           lambda: self.render_template(entity=self.get_entity_or_abort(id)))
+
     def get(self, id):
-        entity = self.get_entity_or_abort(id)
-        return self.render_template(entity=entity)
+        if self.version_attr is None:
+            return self.render_entity(id)
+
+        try:
+            version = self.get_repository().get_version(self.version_attr, id)
+        except ObjectNotFound:
+            abort(404)
+
+        etag = self.get_etag(id, version)
+
+        return self.make_conditional(etag, self.get_last_modified(version), lambda: self.render_entity(id))
 
 
 class CreateView(ProcessFormView):
@@ -221,12 +637,12 @@ class UpdateView(ProcessFormView):
         self.get_repository().update(entity, **kwargs)
 
     def get(self, id):
-        entity = self.get_entity_or_abort(id)
+        entity = self.get_entity_or_abort(id, cached=False)
         form = self.get_form(obj=entity)
         return self.render_template(form=form, entity=entity)
 
     def post(self, id):
-        entity = self.get_entity_or_abort(id)
+        entity = self.get_entity_or_abort(id, cached=False)
         form = self.get_form(request.form, obj=entity)
 
         if form.validate_on_submit():
@@ -237,14 +653,27 @@ class UpdateView(ProcessFormView):
 
 
 class DeleteView(ProcessFormView):
-    """View for deleting an entity."""
+    """
+    View for deleting an entity.
+
+    If possible, the entity is deleted by the primary key with a single DELETE statement,
+    see :py:meth:`~flask_pony.repositories.PonyRepository.can_delete_by_pk`.
+    Otherwise it is loaded and deleted by Pony, which processes relations and calls the hooks.
+    """
 
     def post(self, id):
-        entity = self.get_entity_or_abort(id)
-        entity.delete()
+        repository = self.get_repository()
+
+        if repository.can_delete_by_pk():
+            if not repository.delete_by_pk(id):
+                abort(404)
+        else:
+            repository.delete(self.get_entity_or_abort(id, cached=False))
+
         return redirect(self.get_success_url())
 
 
 __all__ = (
-    'ListView', 'ShowView', 'CreateView', 'UpdateView', 'DeleteView'
+    'ListView', 'ShowView', 'CreateView', 'UpdateView', 'DeleteView', 'ExportView',
+    'AutocompleteView',
 )
@@ -31,7 +31,7 @@ setup(
     author_email='office@kyzima-spb.com',
     description='PonyORM for your Flask application',
     long_description=README,
-    packages=find_packages(),
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*')),
     zip_safe=False,
     include_package_data=True,
     platforms='any',